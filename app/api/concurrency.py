@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from os import environ
+
+from app.api import metrics
+
+# Environment Configuration Variables
+fanout_workers = int(environ.get('FANOUT_WORKERS', 20))
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_done = object()
+
+
+def get_executor():
+    """
+    Returns the bounded thread pool shared by every fan-out in this process
+    """
+    global _executor, _executor_pid
+    with _lock:
+        if _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=fanout_workers, thread_name_prefix='fanout')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def submit(func, *args, **kwargs):
+    return get_executor().submit(metrics.bind(func), *args, **kwargs)
+
+
+def gather(tasks, timeouts=None, default_timeout=None):
+    """
+    Runs each callable in tasks (a dict of name -> callable) on the shared pool.
+
+    Every task gets its own deadline from timeouts, falling back to default_timeout,
+    measured from when gather was called. Returns (results, errors) dicts keyed by
+    task name; a task that raised or missed its deadline only appears in errors.
+    """
+    timeouts = timeouts or {}
+    started = time.time()
+    futures = dict((name, submit(func)) for name, func in tasks.items())
+
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        timeout = timeouts.get(name, default_timeout)
+        remaining = None if timeout is None else max(0, started + timeout - time.time())
+        try:
+            results[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            future.cancel()
+            errors[name] = TimeoutError('{} timed out after {}s'.format(name, timeout))
+        except Exception as e:
+            errors[name] = e
+    return results, errors
+
+
+def map_bounded(func, items, limit, timeout=None):
+    """
+    Calls func(item) for every distinct item with at most limit calls in flight.
+
+    Returns (results, errors) dicts keyed by item in input order. Items not
+    finished within timeout seconds are reported in errors as timed out.
+    """
+    distinct_items = list(dict.fromkeys(items))
+    pending_items = iter(distinct_items)
+    deadline = None if timeout is None else time.time() + timeout
+    in_flight = {}
+    results = {}
+    errors = {}
+
+    def fill():
+        while len(in_flight) < limit:
+            item = next(pending_items, _done)
+            if item is _done:
+                return
+            in_flight[submit(func, item)] = item
+
+    fill()
+    while in_flight:
+        remaining = None if deadline is None else max(0, deadline - time.time())
+        finished, _ = wait(list(in_flight), timeout=remaining, return_when=FIRST_COMPLETED)
+        if not finished:
+            break
+        for future in finished:
+            item = in_flight.pop(future)
+            try:
+                results[item] = future.result()
+            except Exception as e:
+                errors[item] = e
+        fill()
+
+    for future, item in in_flight.items():
+        future.cancel()
+        errors[item] = TimeoutError('{} timed out after {}s'.format(item, timeout))
+    for item in pending_items:
+        errors[item] = TimeoutError('{} timed out after {}s'.format(item, timeout))
+    results = dict((item, results[item]) for item in distinct_items if item in results)
+    return results, errors
@@ -0,0 +1,85 @@
+import gzip
+import io
+from os import environ
+
+from app.api import metrics
+from app.api.cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Environment Configuration Variables
+conditional_enabled = environ.get('CONDITIONAL_RESPONSES', '1') == '1'
+compress_min_bytes = int(environ.get('COMPRESS_MIN_BYTES', 1024))      # smaller bodies are sent as they are
+gzip_level = int(environ.get('COMPRESS_GZIP_LEVEL', 6))
+brotli_quality = int(environ.get('COMPRESS_BROTLI_QUALITY', 5))
+compressed_cache_size = int(environ.get('COMPRESSED_CACHE_SIZE', 512))
+compressed_cache_ttl = int(environ.get('COMPRESSED_CACHE_TTL', 10 * 60))
+
+# Location resources polled by clients; their bodies only change when the provider data does
+CONDITIONAL_ENDPOINTS = frozenset(['/weather', '/fiveday', '/restaurants', '/events', '/hotels', '/hotel', '/trip'])
+
+# Encodings offered, in order of preference when the client rates them equally
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# Many clients poll the same location, so the same body is compressed once per worker
+compressed_bodies = TTLCache(maxsize=compressed_cache_size, ttl=compressed_cache_ttl)
+metrics.registry.register(metrics.cache_collector('compressed_bodies', compressed_bodies))
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    # mtime=0 keeps the output, and so the cached copy, identical for identical bodies;
+    # gzip.compress only takes mtime from Python 3.8
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=gzip_level, mtime=0) as stream:
+        stream.write(data)
+    return buffer.getvalue()
+
+
+def init_app(app):
+    """
+    Tags location responses with an ETag computed from the body, answers a matching
+    If-None-Match with 304 Not Modified, and compresses bodies of at least
+    COMPRESS_MIN_BYTES with brotli or gzip when the client accepts it.
+
+    The ETag is weak because it stays the same whichever encoding is sent. Register
+    after metrics.init_app so the request metrics record the 304s.
+    """
+    from flask import request
+
+    if not conditional_enabled:
+        return
+
+    @app.after_request
+    def conditional_response(response):
+        if (request.method not in ('GET', 'HEAD') or response.status_code != 200 or response.direct_passthrough
+                or request.url_rule is None or request.url_rule.rule not in CONDITIONAL_ENDPOINTS):
+            return response
+
+        response.add_etag(weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Accept-Encoding')
+        response.make_conditional(request)
+        if response.status_code != 200:
+            return response
+
+        data = response.get_data()
+        if len(data) < compress_min_bytes or 'Content-Encoding' in response.headers:
+            return response
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+        if encoding is None:
+            return response
+
+        key = (response.get_etag()[0], encoding)
+        body = compressed_bodies.get(key)
+        if body is None:
+            with metrics.span('compress', encoding=encoding):
+                body = compress(data, encoding)
+            compressed_bodies.set(key, body)
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,55 @@
+import json
+from os import environ
+
+from flask import make_response
+
+from app.api.records import Record
+
+# Environment Configuration Variables
+json_backend = environ.get('JSON_BACKEND', 'auto')    # auto (orjson when installed), orjson or json
+
+if json_backend in ('auto', 'orjson'):
+    try:
+        import orjson
+    except ImportError:
+        if json_backend == 'orjson':
+            raise
+        orjson = None
+else:
+    orjson = None
+
+
+def default(value):
+    if isinstance(value, Record):
+        return value.as_dict()
+    raise TypeError('{} is not JSON serializable'.format(type(value).__name__))
+
+
+if orjson is not None:
+    def dumps(value):
+        """
+        Compact JSON text of value, with records written as objects
+        """
+        return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    loads = orjson.loads
+else:
+    _encoder = json.JSONEncoder(separators=(',', ':'), default=default)
+
+    def dumps(value):
+        """
+        Compact JSON text of value, with records written as objects
+        """
+        return _encoder.encode(value)
+
+    loads = json.loads
+
+
+def output_json(data, code, headers=None):
+    """
+    flask-restful representation for application/json using the encoder above
+    """
+    response = make_response(dumps(data) + '\n', code)
+    response.headers.extend(headers or {})
+    response.mimetype = 'application/json'
+    return response
@@ -0,0 +1,94 @@
+from collections import Counter
+
+# Shapes /fiveday can answer in; raw is the original list of points, each naming the city
+GRANULARITIES = ('raw', '3h', 'daily')
+
+# Fields each granularity can project to
+FIELDS = {
+    'raw': ('city', 'time', 'temperature', 'description'),
+    '3h': ('time', 'temperature', 'description'),
+    'daily': ('date', 'min', 'max', 'mean', 'description')
+}
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(fields, granularity):
+    """
+    Returns the requested field names in response order, or None for all of them
+    """
+    if not fields:
+        return None
+    requested = set(name.strip() for name in fields.split(',') if name.strip())
+    unknown = requested.difference(FIELDS[granularity])
+    if unknown:
+        raise InvalidFields('Unknown field(s) for {} granularity: {}; expected any of {}'.format(
+            granularity, ', '.join(sorted(unknown)), ', '.join(FIELDS[granularity])))
+    return tuple(name for name in FIELDS[granularity] if name in requested)
+
+
+def shape(five_day, granularity='raw', fields=None):
+    """
+    Reshapes the cached forecast points of fetch_forecast.
+
+    raw keeps the original list. 3h and daily answer {'city', 'granularity', 'forecast'},
+    naming the city once; daily reduces each local day to its min, max and mean
+    temperature and the description seen most often that day.
+    """
+    if granularity == 'raw':
+        return _project(five_day, fields)
+
+    if granularity == 'daily':
+        points = daily(five_day)
+    else:
+        points = [
+            {'time': point['time'], 'temperature': point['temperature'], 'description': point['description']}
+            for point in five_day
+        ]
+    return {
+        'city': five_day[0]['city'] if five_day else None,
+        'granularity': granularity,
+        'forecast': _project(points, fields)
+    }
+
+
+def daily(five_day):
+    """
+    Aggregates three-hourly points into one summary per day in a single pass.
+
+    Points arrive in time order, so a new date starts a new day.
+    """
+    days = []
+    day = None
+    for point in five_day:
+        date, temperature = point['time'][:10], point['temperature']
+        if day is None or day[0] != date:
+            day = [date, temperature, temperature, 0, 0, Counter()]
+            days.append(day)
+        elif temperature < day[1]:
+            day[1] = temperature
+        elif temperature > day[2]:
+            day[2] = temperature
+        day[3] += temperature
+        day[4] += 1
+        day[5][point['description']] += 1
+
+    # Ties between descriptions go to the one seen first that day
+    return [
+        {
+            'date': date,
+            'min': low,
+            'max': high,
+            'mean': round(total / float(count), 2),
+            'description': descriptions.most_common(1)[0][0]
+        }
+        for date, low, high, total, count, descriptions in days
+    ]
+
+
+def _project(points, fields):
+    if fields is None:
+        return points
+    return [dict((name, point[name]) for name in fields) for point in points]
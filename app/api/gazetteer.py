@@ -0,0 +1,228 @@
+"""
+Offline ZIP code gazetteer: zipcode -> city, lat and lon without an upstream call.
+
+The data file is a memory-mapped binary of sorted columns, so every worker shares
+the same pages and a lookup is one binary search. The slug build runs
+
+    python -m app.api.gazetteer download app/static/zipcodes.bin
+
+(bin/post_compile) to fetch the GeoNames US postal code dump and convert it. The
+dump is licensed CC BY 4.0 by GeoNames (https://www.geonames.org/). A local file
+is converted with
+
+    python -m app.api.gazetteer build US.txt app/static/zipcodes.bin --format geonames
+
+or from any CSV with zip, city, lat and lon columns.
+
+File layout (little endian):
+    header   magic 'ZIPG', version, count              (3 x uint32)
+    zips     sorted zipcodes                           (count x uint32)
+    lats     latitudes                                 (count x float32)
+    lons     longitudes                                (count x float32)
+    offsets  start of each city name in the name blob  ((count + 1) x uint32)
+    names    utf-8 city names
+"""
+import argparse
+import array
+import csv
+import io
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import zipfile
+from bisect import bisect_left
+from os import environ
+from urllib.request import urlopen
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ZIPG'
+VERSION = 1
+HEADER = struct.Struct('<4sII')
+
+# Environment Configuration Variables
+default_path = environ.get('GAZETTEER_PATH', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'zipcodes.bin'))
+geonames_url = environ.get('GEONAMES_URL', 'https://download.geonames.org/export/zip/US.zip')
+
+
+def parse_zipcode(zipcode):
+    """
+    Returns the 5 digit zipcode as an int, or None for anything that is not a US zipcode
+    """
+    zipcode = str(zipcode).strip().split('-')[0]
+    if len(zipcode) != 5 or not zipcode.isdigit():
+        return None
+    return int(zipcode)
+
+
+class Gazetteer(object):
+    def __init__(self, path=None):
+        self.path = path or default_path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.count = 0
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER.size:
+                logger.warning('No gazetteer at %s; every zipcode will be geocoded through Open Weather. '
+                               'Build it with `python -m app.api.gazetteer download`', self.path)
+                return
+
+            with open(self.path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, count = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC or version != VERSION:
+                logger.warning('%s is not a version %s gazetteer file, ignoring it', self.path, VERSION)
+                return
+
+            view = memoryview(self._mmap)
+            offset = HEADER.size
+            self.zips, offset = self._column(view, offset, 'I', count)
+            self.lats, offset = self._column(view, offset, 'f', count)
+            self.lons, offset = self._column(view, offset, 'f', count)
+            self.offsets, offset = self._column(view, offset, 'I', count + 1)
+            self.names = view[offset:]
+            self.count = count
+
+    @staticmethod
+    def _column(view, offset, typecode, count):
+        end = offset + count * 4
+        if sys.byteorder == 'little':
+            return view[offset:end].cast(typecode), end
+        # Big endian hosts pay for a private copy
+        column = array.array(typecode)
+        column.frombytes(view[offset:end])
+        column.byteswap()
+        return column, end
+
+    def lookup(self, zipcode):
+        """
+        Returns {'city', 'lat', 'lon'} for the zipcode, or None when it is not in the gazetteer
+        """
+        if not self._loaded:
+            self._load()
+        key = parse_zipcode(zipcode)
+        if key is None or not self.count:
+            return None
+
+        index = bisect_left(self.zips, key)
+        if index == self.count or self.zips[index] != key:
+            return None
+        return {
+            'city': bytes(self.names[self.offsets[index]:self.offsets[index + 1]]).decode('utf-8'),
+            'lat': round(self.lats[index], 4),
+            'lon': round(self.lons[index], 4)
+        }
+
+    def __len__(self):
+        if not self._loaded:
+            self._load()
+        return self.count
+
+
+def write(records, path):
+    """
+    Writes (zipcode, city, lat, lon) records to path, keeping the first record for a repeated zipcode
+    """
+    rows = {}
+    for zipcode, city, lat, lon in records:
+        key = parse_zipcode(zipcode)
+        if key is not None and key not in rows:
+            rows[key] = (city, float(lat), float(lon))
+
+    zips = array.array('I', sorted(rows))
+    lats = array.array('f', (rows[key][1] for key in zips))
+    lons = array.array('f', (rows[key][2] for key in zips))
+    offsets = array.array('I', [0])
+    names = bytearray()
+    for key in zips:
+        names.extend(rows[key][0].encode('utf-8'))
+        offsets.append(len(names))
+
+    columns = [zips, lats, lons, offsets]
+    if sys.byteorder != 'little':
+        for column in columns:
+            column.byteswap()
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(zips)))
+        for column in columns:
+            f.write(column.tobytes())
+        f.write(bytes(names))
+    os.replace(tmp_path, path)
+    return len(zips)
+
+
+def read_geonames(f):
+    # Tab separated: country, postal code, place name, admin names and codes..., latitude, longitude, accuracy
+    for row in csv.reader(f, delimiter='\t'):
+        if len(row) >= 11:
+            yield row[1], row[2], row[9], row[10]
+
+
+def read_csv(f):
+    reader = csv.DictReader(f)
+    columns = dict((name.strip().lower(), name) for name in reader.fieldnames)
+
+    def column(*aliases):
+        for alias in aliases:
+            if alias in columns:
+                return columns[alias]
+        raise ValueError('CSV needs one of the columns {}'.format(', '.join(aliases)))
+
+    zip_column = column('zip', 'zipcode', 'zip_code', 'postal_code', 'postalcode')
+    city_column = column('city', 'place_name', 'name')
+    lat_column = column('lat', 'latitude')
+    lon_column = column('lon', 'lng', 'long', 'longitude')
+    for row in reader:
+        yield row[zip_column], row[city_column], row[lat_column], row[lon_column]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the offline ZIP code gazetteer')
+    subparsers = parser.add_subparsers(dest='command')
+    build = subparsers.add_parser('build', help='Convert a CSV or GeoNames dump to the binary format')
+    build.add_argument('source')
+    build.add_argument('output', nargs='?', default=default_path)
+    build.add_argument('--format', choices=['csv', 'geonames'], default='csv')
+    download = subparsers.add_parser('download', help='Fetch the GeoNames US postal codes and convert them')
+    download.add_argument('output', nargs='?', default=default_path)
+    download.add_argument('--url', default=geonames_url)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        with open(args.source, newline='', encoding='utf-8') as f:
+            reader = read_geonames if args.format == 'geonames' else read_csv
+            count = write(reader(f), args.output)
+    elif args.command == 'download':
+        count = write(read_geonames(fetch_geonames(args.url)), args.output)
+    else:
+        parser.print_help()
+        return 1
+    print('Wrote {} zipcodes to {}'.format(count, args.output))
+    return 0
+
+
+def fetch_geonames(url):
+    """
+    Returns the text of the dump inside the GeoNames zip at url, e.g. US.txt from US.zip
+    """
+    with urlopen(url, timeout=60) as response:
+        archive = zipfile.ZipFile(io.BytesIO(response.read()))
+    name = [name for name in archive.namelist() if name.endswith('.txt') and name != 'readme.txt'][0]
+    return io.StringIO(archive.read(name).decode('utf-8'), newline='')
+
+
+gazetteer = Gazetteer()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+
+from app.api import metrics
+from app.api.resilience import SingleFlight
+from app.api.shared_store import SharedStore
+
+logger = logging.getLogger(__name__)
+
+# Environment Configuration Variables
+geo_tile_store_path = environ.get('GEO_TILE_STORE_PATH')
+geo_tile_degrees = float(environ.get('GEO_TILE_DEGREES', 0.25))           # about 28km of latitude per tile
+geo_tile_ttl = int(environ.get('GEO_TILE_TTL', 24 * 60 * 60))
+geo_tile_retain = int(environ.get('GEO_TILE_RETAIN', 7 * 24 * 60 * 60))  # kept past expiry as an outage fallback
+geo_tile_fetch_concurrency = int(environ.get('GEO_TILE_FETCH_CONCURRENCY', 16))
+geo_max_tiles = int(environ.get('GEO_MAX_TILES', 64))                     # largest area a single query may cover
+
+EARTH_RADIUS = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+SORTS = ('distance', 'rating')
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS geo_tiles (
+        kind TEXT NOT NULL,
+        tile_row INTEGER NOT NULL,
+        tile_col INTEGER NOT NULL,
+        fetched_at REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (kind, tile_row, tile_col)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS geo_places (
+        kind TEXT NOT NULL,
+        xid TEXT NOT NULL,
+        tile_row INTEGER NOT NULL,
+        tile_col INTEGER NOT NULL,
+        name TEXT,
+        rating NUMERIC,
+        lat REAL NOT NULL,
+        lon REAL NOT NULL,
+        PRIMARY KEY (kind, xid)
+    )''',
+    'CREATE INDEX IF NOT EXISTS ix_geo_places_tile ON geo_places (kind, tile_row, tile_col)',
+    'CREATE INDEX IF NOT EXISTS ix_geo_places_lat ON geo_places (kind, lat)',
+)
+
+
+class InvalidArea(ValueError):
+    pass
+
+
+class TileIndex(object):
+    """
+    Places of one kind cached by grid tile in a SQLite file shared by all workers.
+
+    The map is cut into squares of GEO_TILE_DEGREES. A query fetches only the tiles it
+    covers that are missing or expired, each with one bounding box call to
+    fetch_tile(south, west, north, east), and answers from the stored places, so
+    neighbouring zipcodes share most of their upstream calls. An expired tile is
+    still served while its refresh fails.
+    """
+    def __init__(self, kind, fetch_tile, store=None, degrees=None, ttl=None):
+        self.kind = kind
+        self.fetch_tile = fetch_tile
+        self.store = store or SharedStore(geo_tile_store_path, SCHEMA)
+        self.degrees = degrees or geo_tile_degrees
+        self.ttl = geo_tile_ttl if ttl is None else ttl
+        self.hits = 0
+        self.misses = 0
+        self.fallback_hits = 0
+        self._flights = SingleFlight()
+        self._fills = 0
+        self._executor = None
+        self._executor_pid = None
+
+    def radius(self, lat, lon, radius, sort='distance', limit=None):
+        """
+        Places within radius meters of (lat, lon), each with its distance in meters
+        """
+        if radius <= 0:
+            raise InvalidArea('radius must be positive')
+        lat_delta = radius / METERS_PER_DEGREE
+        lon_delta = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        places = self._query(lat - lat_delta, lon - lon_delta, lat + lat_delta, lon + lon_delta, lat, lon)
+        return order([place for place in places if place['distance'] <= radius], sort, limit)
+
+    def bbox(self, south, west, north, east, sort='distance', limit=None):
+        """
+        Places inside the box, each with its distance in meters from the centre of the box
+        """
+        if south >= north or west >= east:
+            raise InvalidArea('bbox must be south,west,north,east with south < north and west < east')
+        places = self._query(south, west, north, east, (south + north) / 2.0, (west + east) / 2.0)
+        return order(places, sort, limit)
+
+    def tiles(self, south, west, north, east):
+        south, north = max(south, -90.0), min(north, 90.0)
+        west, east = max(west, -180.0), min(east, 180.0)
+        rows = range(int(math.floor(south / self.degrees)), int(math.floor(north / self.degrees)) + 1)
+        cols = range(int(math.floor(west / self.degrees)), int(math.floor(east / self.degrees)) + 1)
+        if len(rows) * len(cols) > geo_max_tiles:
+            raise InvalidArea('The area covers {} tiles; at most {} are allowed'.format(
+                len(rows) * len(cols), geo_max_tiles))
+        return [(row, col) for row in rows for col in cols]
+
+    def _query(self, south, west, north, east, lat, lon):
+        self.ensure(self.tiles(south, west, north, east))
+        rows = self.store.execute(
+            '''SELECT xid, name, rating, lat, lon FROM geo_places
+               WHERE kind = ? AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?''',
+            (self.kind, south, north, west, east)
+        )
+        return [
+            {'name': name, 'rating': rating, 'xid': xid, 'distance': int(round(distance(lat, lon, place_lat, place_lon)))}
+            for xid, name, rating, place_lat, place_lon in rows
+        ]
+
+    def ensure(self, tiles):
+        """
+        Fetches the tiles that are missing or expired; raises the fetch error of a tile never fetched
+        """
+        now = time.time()
+        known = dict(
+            ((row, col), expires_at) for row, col, expires_at in self.store.execute(
+                '''SELECT tile_row, tile_col, expires_at FROM geo_tiles
+                   WHERE kind = ? AND tile_row BETWEEN ? AND ? AND tile_col BETWEEN ? AND ?''',
+                (self.kind, min(t[0] for t in tiles), max(t[0] for t in tiles),
+                 min(t[1] for t in tiles), max(t[1] for t in tiles))
+            )
+        )
+        stale = [tile for tile in tiles if known.get(tile, 0) <= now]
+        self.hits += len(tiles) - len(stale)
+        self.misses += len(stale)
+        if not stale:
+            return
+
+        if self._executor_pid != os.getpid():
+            # Its own pool rather than the fan-out pool, which may be running this very query
+            self._executor = ThreadPoolExecutor(max_workers=geo_tile_fetch_concurrency, thread_name_prefix='geotiles')
+            self._executor_pid = os.getpid()
+        futures = [(tile, self._executor.submit(metrics.bind(self._fill), tile)) for tile in stale]
+        for tile, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                if tile not in known:
+                    raise
+                # An expired tile beats no answer while the provider is down
+                self.fallback_hits += 1
+                logger.warning('Serving expired %s tile %s: %s', self.kind, tile, e)
+
+    def _fill(self, tile):
+        return self._flights.do(tile, lambda: self._fetch(tile))
+
+    def _fetch(self, tile):
+        row, col = tile
+        # Another request or worker may have filled it since this query looked
+        filled = self.store.execute(
+            'SELECT 1 FROM geo_tiles WHERE kind = ? AND tile_row = ? AND tile_col = ? AND expires_at > ?',
+            (self.kind, row, col, time.time())
+        ).fetchone()
+        if filled is not None:
+            return
+        south, west = row * self.degrees, col * self.degrees
+        north, east = south + self.degrees, west + self.degrees
+        places = [
+            # A place on an edge belongs to the tile it starts, so each place has exactly one tile
+            place for place in self.fetch_tile(south, west, north, east)
+            if south <= place['lat'] < north and west <= place['lon'] < east
+        ]
+        now = time.time()
+        with self.store.transaction() as conn:
+            conn.execute('DELETE FROM geo_places WHERE kind = ? AND tile_row = ? AND tile_col = ?', (self.kind, row, col))
+            conn.executemany(
+                '''INSERT OR REPLACE INTO geo_places (kind, xid, tile_row, tile_col, name, rating, lat, lon)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                [(self.kind, place['xid'], row, col, place['name'], place['rating'], place['lat'], place['lon'])
+                 for place in places]
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO geo_tiles (kind, tile_row, tile_col, fetched_at, expires_at) VALUES (?, ?, ?, ?, ?)',
+                (self.kind, row, col, now, now + self.ttl)
+            )
+        self._fills += 1
+        if self._fills % 100 == 0:
+            self.prune()
+
+    def prune(self):
+        cutoff = time.time() - geo_tile_retain
+        with self.store.transaction() as conn:
+            conn.execute(
+                '''DELETE FROM geo_places WHERE kind = ? AND (tile_row, tile_col) IN (
+                       SELECT tile_row, tile_col FROM geo_tiles WHERE kind = ? AND expires_at < ?)''',
+                (self.kind, self.kind, cutoff)
+            )
+            conn.execute('DELETE FROM geo_tiles WHERE kind = ? AND expires_at < ?', (self.kind, cutoff))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'fallback_hits': self.fallback_hits}
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """
+    Great circle distance in meters
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2 +
+         math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def rating_rank(rating):
+    # OpenTripMap rates places 0-3, with an h suffix for heritage sites, e.g. '3h'
+    rating = str(rating or '')
+    return int(rating[0]) if rating[:1].isdigit() else 0
+
+
+def order(places, sort='distance', limit=None):
+    """
+    Sorts by distance, or by rating best first with distance breaking ties, and keeps the first limit
+    """
+    if sort == 'rating':
+        places = sorted(places, key=lambda place: (-rating_rank(place['rating']), place.get('distance', 0)))
+    else:
+        places = sorted(places, key=lambda place: place.get('distance', 0))
+    return places if limit is None else places[:limit]
@@ -0,0 +1,204 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from os import environ
+
+from passlib.context import CryptContext
+
+from app.api import metrics
+
+# Environment Configuration Variables
+hash_rounds = int(environ.get('PASSWORD_HASH_ROUNDS', 29000))
+# Same default as gunicorn.conf.py; every web worker has its own pool, so they split the cores between them
+web_concurrency = int(environ.get('WEB_CONCURRENCY', min(4, (os.cpu_count() or 1) * 2 + 1)))
+hash_workers = int(environ.get('HASH_WORKERS', max(1, (os.cpu_count() or 1) // web_concurrency)))  # 0 hashes on the request thread
+hash_queue_size = int(environ.get('HASH_QUEUE_SIZE', 4 * hash_workers))
+hash_timeout = float(environ.get('HASH_TIMEOUT', 10))
+hash_start_method = environ.get('HASH_START_METHOD', 'forkserver')
+
+
+class HashingBusy(Exception):
+    """
+    Raised when every hashing worker is busy and the wait queue is full
+    """
+
+
+def make_context(rounds):
+    # Pinning min and max to the configured rounds flags any hash made with other parameters for rehashing
+    return CryptContext(
+        schemes=['pbkdf2_sha256'],
+        pbkdf2_sha256__default_rounds=rounds,
+        pbkdf2_sha256__min_rounds=rounds,
+        pbkdf2_sha256__max_rounds=rounds
+    )
+
+
+_contexts = {}
+
+
+def _context(rounds):
+    if rounds not in _contexts:
+        _contexts[rounds] = make_context(rounds)
+    return _contexts[rounds]
+
+
+def _hash(password, rounds):
+    return _context(rounds).hash(password)
+
+
+def _ready():
+    return os.getpid()
+
+
+def _verify_and_update(password, hash, rounds):
+    return _context(rounds).verify_and_update(password, hash)
+
+
+class HashingExecutor(object):
+    """
+    Runs PBKDF2 in a process pool so logins cannot starve the request threads.
+
+    At most workers + queue_size hashes are accepted at once; past that callers
+    get HashingBusy straight away instead of queueing behind a login spike. A slot
+    is held until its hash finishes in the pool, even when the caller has given
+    up waiting for it, so timeouts cannot let the pool's own queue grow unbounded.
+    """
+    def __init__(self, workers=None, queue_size=None, rounds=None, timeout=None):
+        self.workers = hash_workers if workers is None else workers
+        self.queue_size = hash_queue_size if queue_size is None else queue_size
+        self.rounds = rounds or hash_rounds
+        self.timeout = timeout or hash_timeout
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def hash_password(self, password):
+        with metrics.span('hashing', op='hash'):
+            return self._run(_hash, password, self.rounds)
+
+    def verify_and_update(self, password, hash):
+        """
+        Returns (valid, new_hash); new_hash is set when the stored hash uses outdated parameters
+        """
+        with metrics.span('hashing', op='verify'):
+            return self._run(_verify_and_update, password, hash, self.rounds)
+
+    def warm_up(self):
+        """
+        Starts the worker processes now instead of on the first registration or login
+        """
+        if not self.workers:
+            return
+        pool = self._get_pool()
+        for future in [pool.submit(_ready) for _ in range(self.workers)]:
+            future.result(timeout=self.timeout)
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusy()
+
+        started = time.time()
+        with self._lock:
+            self.in_flight += 1
+        future = None
+        try:
+            future = self._get_pool().submit(func, *args)
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise HashingBusy()
+        except BrokenProcessPool:
+            self._discard_pool()
+            raise HashingBusy()
+        finally:
+            if future is not None and not future.done():
+                # The hash still occupies the pool after the caller gives up; free its slot when it ends
+                future.add_done_callback(lambda future: self._finished(started))
+            else:
+                self._finished(started)
+
+    def _finished(self, started):
+        elapsed = time.time() - started
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+        self._slots.release()
+
+    def _discard_pool(self):
+        # A worker died; start a fresh pool for the next caller
+        with self._lock:
+            self._pool_pid = None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool_pid != os.getpid():
+                options = {}
+                if sys.version_info >= (3, 7):
+                    # Python 3.6 pools always fork
+                    options['mp_context'] = multiprocessing.get_context(hash_start_method)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, **options)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'capacity': self.workers + self.queue_size,
+            'in_flight': self.in_flight,
+            'queued': max(0, self.in_flight - self.workers),
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'avg_seconds': self.total_seconds / self.completed if self.completed else 0.0,
+            'max_seconds': self.max_seconds
+        }
+
+
+def queue_collector(executor):
+    """
+    Exports the pool's in-flight and queued hashes as gauges
+    """
+    def collect():
+        stats = executor.stats()
+        return {
+            ('trippy_hashing_in_flight', ()): stats['in_flight'],
+            ('trippy_hashing_queued', ()): stats['queued']
+        }
+    return collect
+
+
+def rejection_collector(executor):
+    """
+    Exports hashes turned away as trippy_hashing_rejected_total, labelled full or timeout
+    """
+    def collect():
+        stats = executor.stats()
+        return {
+            ('trippy_hashing_rejected_total', (('reason', 'full'),)): stats['rejected'],
+            ('trippy_hashing_rejected_total', (('reason', 'timeout'),)): stats['timed_out']
+        }
+    return collect
+
+
+hashing_executor = HashingExecutor()
+metrics.registry.register(queue_collector(hashing_executor), kind='gauge')
+metrics.registry.register(rejection_collector(hashing_executor))
@@ -0,0 +1,246 @@
+import array
+import csv
+import ipaddress
+import os
+import threading
+import time
+from bisect import bisect_right
+from os import environ
+
+import requests
+from flask import request
+
+from app.api import metrics, upstream
+from app.api.cache import TTLCache
+from app.api.quota import quota
+from app.api.resilience import UpstreamUnavailable
+
+# Environment Configuration Variables
+ip_geo_backend = environ.get('IP_GEO_BACKEND', 'chain')    # offline, remote or chain (offline then remote)
+ip_geo_database = environ.get('IP_GEO_DATABASE', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'ip_ranges.csv'))
+trusted_proxy_count = int(environ.get('TRUSTED_PROXY_COUNT', 1))     # Heroku's router appends one entry
+ip_cache_size = int(environ.get('IP_CACHE_SIZE', 8192))
+ip_cache_ttl = int(environ.get('IP_CACHE_TTL', 6 * 60 * 60))
+ip_api_url = environ.get('IP_API_URL', 'http://ip-api.com/json')
+
+IPV4_MAPPED = int(ipaddress.IPv6Address('::ffff:0:0'))
+
+
+def client_ip(forwarded_for, remote_addr, trusted_proxies=None):
+    """
+    Returns the client address from an X-Forwarded-For chain.
+
+    Each trusted proxy appends the address it received the request from, so the
+    client is trusted_proxies entries from the end. Anything further left was sent
+    by the client itself and cannot be trusted.
+    """
+    trusted_proxies = trusted_proxy_count if trusted_proxies is None else trusted_proxies
+    if not forwarded_for or trusted_proxies < 1:
+        return remote_addr
+
+    hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+    if not hops:
+        return remote_addr
+    hop = hops[max(0, len(hops) - trusted_proxies)]
+    try:
+        return str(ipaddress.ip_address(hop))
+    except ValueError:
+        return remote_addr
+
+
+def prefix_key(ip):
+    """
+    Cache key shared by every address in the same /24 (IPv4) or /48 (IPv6)
+    """
+    address = ipaddress.ip_address(ip)
+    prefix = 24 if address.version == 4 else 48
+    return str(ipaddress.ip_network('{}/{}'.format(address, prefix), strict=False))
+
+
+class OfflineBackend(object):
+    """
+    Sorted interval index over an IP range database, answered with one bisect per lookup.
+
+    Accepts a CSV with start, end, zipcode, city and country columns (addresses or
+    integers), or the headerless IP2Location LITE DB11 layout.
+    """
+    def __init__(self, path=None):
+        self.path = path or ip_geo_database
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.ranges = 0
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.path):
+                return
+
+            v4, v6 = [], []
+            with open(self.path, newline='', encoding='utf-8') as f:
+                for start, end, location in self._read(f):
+                    if end <= 0xFFFFFFFF:
+                        v4.append((start, end, location))
+                    elif IPV4_MAPPED <= start and end <= IPV4_MAPPED + 0xFFFFFFFF:
+                        v4.append((start - IPV4_MAPPED, end - IPV4_MAPPED, location))
+                    else:
+                        v6.append((start, end, location))
+
+            self.v4 = self._index(v4, 'I')
+            self.v6 = self._index(v6, None)
+            self.ranges = len(v4) + len(v6)
+
+    @staticmethod
+    def _index(rows, typecode):
+        rows.sort(key=lambda row: row[0])
+        # Ranges sharing a location point at one dict instead of a copy each
+        locations = {}
+        records = []
+        for _, _, location in rows:
+            key = tuple(sorted(location.items()))
+            records.append(locations.setdefault(key, location))
+        starts = [row[0] for row in rows]
+        ends = [row[1] for row in rows]
+        if typecode:
+            starts, ends = array.array(typecode, starts), array.array(typecode, ends)
+        return starts, ends, records
+
+    @staticmethod
+    def _read(f):
+        first = f.readline()
+        f.seek(0)
+        if first[:1] == '"' or first[:1].isdigit():
+            # IP2Location: ip_from, ip_to, country_code, country_name, region, city, lat, lon, zip, timezone
+            for row in csv.reader(f):
+                if len(row) >= 9 and row[8] not in ('', '-'):
+                    yield int(row[0]), int(row[1]), {'city': row[5], 'country': row[3], 'zipcode': row[8]}
+            return
+
+        for row in csv.DictReader(f):
+            row = dict((key.strip().lower(), value) for key, value in row.items())
+            yield (_to_int(row['start']), _to_int(row['end']),
+                   {'city': row.get('city'), 'country': row.get('country'), 'zipcode': row['zipcode']})
+
+    def lookup(self, ip):
+        if not self._loaded:
+            self._load()
+        if not self.ranges:
+            return None
+
+        address = ipaddress.ip_address(ip)
+        value = int(address)
+        if address.version == 6 and address.ipv4_mapped:
+            address, value = address.ipv4_mapped, int(address.ipv4_mapped)
+        starts, ends, records = self.v4 if address.version == 4 else self.v6
+
+        index = bisect_right(starts, value) - 1
+        if index < 0 or value > ends[index]:
+            return None
+        return dict(records[index], ipaddr=ip)
+
+
+class RemoteBackend(object):
+    """
+    ip-api.com lookups cached per /24 or /48 prefix and paced by ip-api's rate limit headers
+    """
+    url = ip_api_url + '/{}'
+
+    def __init__(self, cache=None):
+        self.cache = cache or TTLCache(maxsize=ip_cache_size, ttl=ip_cache_ttl)
+        self.blocked_until = 0
+
+    def lookup(self, ip):
+        key = prefix_key(ip)
+        location = self.cache.get(key)
+        if location is not None:
+            return dict(location, ipaddr=ip)
+
+        # ip-api answers 429 once the window is used up, so stop asking until it resets
+        if time.time() < self.blocked_until:
+            return None
+
+        with metrics.span('upstream', provider='ipapi'):
+            quota.acquire('ipapi')
+            response = upstream.breaker('ipapi').call(lambda: self._request(ip))
+        self._track_rate_limit(response)
+        if response.status_code != 200:
+            return None
+
+        js = response.json()
+        if js.get('status') == 'fail':
+            return None
+        location = {
+            'city': js['city'],
+            'country': js['country'],
+            'zipcode': js['zip']
+        }
+        self.cache.set(key, location)
+        return dict(location, ipaddr=js['query'])
+
+    def _request(self, ip):
+        try:
+            response = upstream.get(self.url.format(ip))
+        except requests.RequestException as e:
+            raise UpstreamUnavailable(str(e))
+        if response.status_code >= 500:
+            raise UpstreamUnavailable('ip-api answered {}'.format(response.status_code))
+        return response
+
+    def _track_rate_limit(self, response):
+        remaining = response.headers.get('X-Rl')
+        reset = response.headers.get('X-Ttl')
+        if response.status_code == 429 or remaining == '0':
+            self.blocked_until = time.time() + int(reset or 60)
+
+
+class ChainBackend(object):
+    def __init__(self, backends):
+        self.backends = backends
+
+    def lookup(self, ip):
+        for backend in self.backends:
+            location = backend.lookup(ip)
+            if location:
+                return location
+        return None
+
+
+def make_backend(name):
+    if name == 'offline':
+        return OfflineBackend()
+    if name == 'remote':
+        return RemoteBackend()
+    return ChainBackend([OfflineBackend(), RemoteBackend()])
+
+
+def _to_int(value):
+    value = value.strip()
+    return int(value) if value.isdigit() else int(ipaddress.ip_address(value))
+
+
+backend = make_backend(ip_geo_backend)
+for remote in [b for b in getattr(backend, 'backends', [backend]) if isinstance(b, RemoteBackend)]:
+    metrics.registry.register(metrics.cache_collector('ip_location', remote.cache))
+
+
+@metrics.timed('location')
+def get_location_by_ip():
+    """
+    Requirement 1.0.0: Find location by user IP address
+    """
+    try:
+        ip_address = client_ip(request.environ.get('HTTP_X_FORWARDED_FOR'), request.remote_addr)
+        location = backend.lookup(ip_address)
+        return {
+            'ipaddr': location['ipaddr'],
+            'city': location['city'],
+            'country': location['country'],
+            'zipcode': location['zipcode']
+        }
+    # Requirement 1.2.0: informs user if no information was found
+    except Exception as e:
+        return {
+            "error": "unknown location for IP: {0}".format(request.remote_addr)
+        }
@@ -0,0 +1,382 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from os import environ
+
+from app.api.shared_store import SharedStore
+
+logger = logging.getLogger(__name__)
+
+# Environment Configuration Variables
+metrics_enabled = environ.get('METRICS_ENABLED', '1') == '1'
+metrics_store_path = environ.get('METRICS_STORE_PATH')
+metrics_flush_interval = float(environ.get('METRICS_FLUSH_INTERVAL', 10))
+metrics_gauge_ttl = float(environ.get('METRICS_GAUGE_TTL', 3 * metrics_flush_interval))  # older gauge readings are ignored
+metrics_token = environ.get('METRICS_TOKEN')                     # when set, /metrics requires it as a Bearer token
+slow_request_ms = float(environ.get('SLOW_REQUEST_MS', 0))        # 0 disables the slow request log
+
+# Upper bounds in seconds; an upstream call lands between 50ms and a few seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Lookup outcomes exported from each cache's stats()
+CACHE_RESULTS = ('hits', 'stale_hits', 'fallback_hits', 'misses')
+
+# Series of exited workers are folded into this pid so totals survive restarts
+RETIRED_PID = 0
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS metric_series (
+        pid INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        labels TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        value TEXT NOT NULL,
+        flushed_at REAL NOT NULL,
+        PRIMARY KEY (pid, name, labels)
+    )''',
+)
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+
+class Registry(object):
+    """
+    Histograms and counters for this process, flushed to the shared store so a
+    scrape of any worker reports the totals of every worker on the host.
+
+    Series are cumulative per pid; a scrape adds up the latest row of each pid.
+    Gauges count only while their worker keeps flushing them. Once a worker has
+    exited, its counters and histograms are folded into the RETIRED_PID rows and
+    its own rows deleted, so totals survive restarts and the table stays small.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.histograms = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._flushed_at = time.time()
+
+    def observe(self, name, labels, seconds):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked from a process that had already recorded; start this pid from zero
+                self.histograms, self._pid = {}, os.getpid()
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def register(self, collector, kind='counter'):
+        """
+        Adds a callable returning {(name, labels tuple): value}, read on every flush. Counters
+        are cumulative; gauges are current values, and both are summed over the workers.
+        """
+        self.collectors.append((collector, kind))
+
+    def maybe_flush(self):
+        if time.time() - self._flushed_at >= metrics_flush_interval:
+            self.flush()
+
+    def flush(self):
+        now = self._flushed_at = time.time()
+        with self._lock:
+            rows = [
+                (self._pid, name, json.dumps(labels), 'histogram', json.dumps([histogram.counts, histogram.sum]), now)
+                for (name, labels), histogram in self.histograms.items()
+            ]
+        for collector, kind in self.collectors:
+            try:
+                for (name, labels), value in collector().items():
+                    rows.append((self._pid, name, json.dumps(labels), kind, json.dumps(value), now))
+            except Exception:
+                logger.warning('Metrics collector failed', exc_info=True)
+        if not rows:
+            return
+        try:
+            with self.store.transaction() as conn:
+                conn.executemany(
+                    '''INSERT OR REPLACE INTO metric_series (pid, name, labels, kind, value, flushed_at)
+                       VALUES (?, ?, ?, ?, ?, ?)''', rows
+                )
+                self._retire_exited(conn, now)
+        except Exception:
+            # Runs in request teardown; a locked or broken store must never fail the request.
+            # The series are cumulative, so the next flush writes everything this one missed.
+            logger.warning('Flushing metrics failed', exc_info=True)
+
+    def _retire_exited(self, conn, now):
+        exited = [pid for (pid,) in conn.execute('SELECT DISTINCT pid FROM metric_series WHERE pid > ?', (RETIRED_PID,))
+                  if not _alive(pid)]
+        if not exited:
+            return
+        retired = {}
+        for pid in [RETIRED_PID] + exited:
+            for name, labels, kind, value in conn.execute(
+                    'SELECT name, labels, kind, value FROM metric_series WHERE pid = ?', (pid,)).fetchall():
+                if kind != 'gauge':
+                    retired[(name, labels, kind)] = _merge(kind, retired.get((name, labels, kind)), json.loads(value))
+        conn.executemany('DELETE FROM metric_series WHERE pid = ?', [(pid,) for pid in exited])
+        conn.executemany(
+            '''INSERT OR REPLACE INTO metric_series (pid, name, labels, kind, value, flushed_at)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            [(RETIRED_PID, name, labels, kind, json.dumps(value), now) for (name, labels, kind), value in retired.items()]
+        )
+
+    def collect(self):
+        """
+        Returns {(name, kind): {labels: value}} summed over every worker
+        """
+        self.flush()
+        series = {}
+        rows = self.store.execute(
+            'SELECT name, labels, kind, value FROM metric_series WHERE kind != ? OR flushed_at >= ?',
+            ('gauge', time.time() - metrics_gauge_ttl)
+        )
+        for name, labels, kind, value in rows:
+            labels = tuple(tuple(pair) for pair in json.loads(labels))
+            by_labels = series.setdefault((name, kind), {})
+            by_labels[labels] = _merge(kind, by_labels.get(labels), json.loads(value))
+        return series
+
+
+def _merge(kind, total, value):
+    # Histograms are stored as [counts, sum]; counters and gauges as a number
+    if total is None:
+        return value
+    if kind != 'histogram':
+        return total + value
+    return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1]]
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Trace(object):
+    """
+    Spans recorded while serving one request, in the order they finished
+    """
+    __slots__ = ('started', 'spans')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+
+
+registry = Registry(SharedStore(metrics_store_path, SCHEMA))
+_local = threading.local()
+_first_request_pid = None
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def bind(func):
+    """
+    Wraps func so spans it records on another thread join the caller's trace
+    """
+    trace = current_trace()
+    if trace is None:
+        return func
+
+    @wraps(func)
+    def bound(*args, **kwargs):
+        previous = current_trace()
+        _local.trace = trace
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.trace = previous
+    return bound
+
+
+def record(name, seconds, **labels):
+    if not metrics_enabled:
+        return
+    registry.observe('trippy_span_seconds', dict(labels, span=name), seconds)
+    trace = current_trace()
+    if trace is not None:
+        trace.spans.append((name, labels, seconds))
+
+
+@contextmanager
+def span(name, **labels):
+    """
+    Times the enclosed block as span name, e.g. span('upstream', provider='zomato')
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started, **labels)
+
+
+def timed(name, **labels):
+    """
+    Decorator form of span
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_startup(phase, seconds):
+    """
+    Records how long a startup phase took, flushed at once because the master process never serves a request
+    """
+    if not metrics_enabled:
+        return
+    registry.observe('trippy_startup_seconds', {'phase': phase}, seconds)
+    registry.flush()
+
+
+def cache_collector(name, cache):
+    """
+    Exports the hit and miss counts of anything with a stats() method as trippy_cache_lookups_total
+    """
+    def collect():
+        stats = cache.stats()
+        return dict(
+            (('trippy_cache_lookups_total', (('cache', name), ('result', result))), stats[result])
+            for result in CACHE_RESULTS if result in stats
+        )
+    return collect
+
+
+def instrument_sqlalchemy():
+    """
+    Records every SQL statement as a db span labelled with its verb
+    """
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    if event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    record('db', time.perf_counter() - started, op=statement.split(None, 1)[0].upper())
+
+
+def init_app(app):
+    """
+    Times every request and logs the span breakdown of those slower than SLOW_REQUEST_MS
+    """
+    from flask import request
+
+    if not metrics_enabled:
+        return
+
+    @app.before_request
+    def start_trace():
+        _local.trace = Trace()
+        _local.status = 500
+
+    @app.after_request
+    def note_status(response):
+        _local.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_trace(error=None):
+        global _first_request_pid
+        trace = current_trace()
+        if trace is None:
+            return
+        _local.trace = None
+        elapsed = time.perf_counter() - trace.started
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        registry.observe('trippy_request_seconds', {
+            'endpoint': endpoint, 'method': request.method, 'status': str(_local.status)
+        }, elapsed)
+        if _first_request_pid != os.getpid():
+            _first_request_pid = os.getpid()
+            registry.observe('trippy_startup_seconds', {'phase': 'first_request'}, elapsed)
+            logger.info('First request in worker %s took %.1fms', _first_request_pid, elapsed * 1000)
+        if slow_request_ms and elapsed * 1000 >= slow_request_ms:
+            logger.warning('Slow request %s %s %s in %.1fms: %s', request.method, request.path, _local.status,
+                           elapsed * 1000, format_spans(trace.spans) or 'no spans')
+        registry.maybe_flush()
+
+
+def format_spans(spans):
+    return ', '.join(
+        '{}{} {:.1f}ms'.format(name, '[{}]'.format(','.join(str(v) for _, v in sorted(labels.items()))) if labels else '',
+                                seconds * 1000)
+        for name, labels, seconds in spans
+    )
+
+
+def render():
+    """
+    Prometheus text exposition of every series, plus a hit ratio per cache
+    """
+    lines = []
+    ratios = {}
+    for (name, kind), by_labels in sorted(registry.collect().items()):
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for labels, value in sorted(by_labels.items()):
+            if kind != 'histogram':
+                lines.append('{}{} {}'.format(name, _labels(labels), value))
+                if name == 'trippy_cache_lookups_total':
+                    cache, result = dict(labels)['cache'], dict(labels)['result']
+                    hits, lookups = ratios.get(cache, (0, 0))
+                    if result != 'fallback_hits':
+                        ratios[cache] = (hits + (value if result != 'misses' else 0), lookups + value)
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(name, _labels(labels + (('le', str(bound)),)), cumulative))
+            lines.append('{}_sum{} {}'.format(name, _labels(labels), round(total, 6)))
+            lines.append('{}_count{} {}'.format(name, _labels(labels), cumulative))
+
+    if ratios:
+        lines.append('# TYPE trippy_cache_hit_ratio gauge')
+        for cache, (hits, lookups) in sorted(ratios.items()):
+            lines.append('trippy_cache_hit_ratio{} {}'.format(
+                _labels((('cache', cache),)), round(hits / float(lookups), 4) if lookups else 0))
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for key, value in labels) + '}'
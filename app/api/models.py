@@ -1,6 +1,15 @@
-from passlib.hash import pbkdf2_sha256 as sha256
+from datetime import datetime, timedelta
+from os import environ
+
+from flask import current_app
+from sqlalchemy import inspect
 
 from app.run import db
+from app.api.hashing import hashing_executor
+from app.api.revocation import GroupCommit, RevocationIndex, revocation_group_commit
+
+# Environment Configuration Variables
+user_list_batch_size = int(environ.get('USER_LIST_BATCH_SIZE', 1000))
 
 
 class UserModel(db.Model):
@@ -20,12 +29,27 @@ class UserModel(db.Model):
 
     @staticmethod
     def generate_hash(password):
-        return sha256.hash(password)
+        return hashing_executor.hash_password(password)
 
 
     @staticmethod
     def verify_hash(password, hash):
-        return sha256.verify(password, hash)
+        return hashing_executor.verify_and_update(password, hash)[0]
+
+
+    def verify_password(self, password):
+        """
+        Checks password against the stored hash, transparently rehashing it when the
+        hashing parameters have changed since it was stored
+        """
+        valid, new_hash = hashing_executor.verify_and_update(password, self.password)
+        if valid and new_hash:
+            self.password = new_hash
+            try:
+                self.save_to_db()
+            except:
+                db.session.rollback()
+        return valid
 
 
     @classmethod
@@ -35,13 +59,31 @@ class UserModel(db.Model):
 
 
     @classmethod
-    def return_all(cls):
-        def to_json(x):
-            return {
-                'username': x.username,
-                'password': x.password
-            }
-        return {'users': list(map(lambda x: to_json(x), UserModel.query.all()))}
+    def iter_public(cls, after_id=0, limit=None, batch_size=None):
+        """
+        Yields {'id', 'username'} for users with id > after_id in id order, never the password hash.
+
+        Rows are read in keyset batches (WHERE id > last seen id), each through a
+        server-side cursor, so memory stays flat however large the table is.
+        """
+        batch_size = batch_size or user_list_batch_size
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            rows = db.session.query(cls.id, cls.username) \
+                .filter(cls.id > after_id) \
+                .order_by(cls.id) \
+                .limit(size) \
+                .execution_options(stream_results=True)
+            count = 0
+            for row_id, username in rows:
+                count += 1
+                after_id = row_id
+                yield {'id': row_id, 'username': username}
+            if remaining is not None:
+                remaining -= count
+            if count < size:
+                return
 
     @classmethod
     def delete_all(cls):
@@ -56,13 +98,88 @@ class UserModel(db.Model):
 class RevokedTokenModel(db.Model):
     __tablename__ = 'revoked_tokens'
     id = db.Column(db.Integer, primary_key=True)
-    jti = db.Column(db.String(120))
+    jti = db.Column(db.String(120), index=True)
+    expires_at = db.Column(db.DateTime, index=True)     # UTC expiry of the revoked token
+
+    @classmethod
+    def from_jwt(cls, raw_jwt):
+        expires_at = None
+        if raw_jwt.get('exp'):
+            expires_at = datetime.utcfromtimestamp(raw_jwt['exp'])
+        return cls(jti=raw_jwt['jti'], expires_at=expires_at)
 
     def add(self):
-        db.session.add(self)
-        db.session.commit()
+        revocation_index.add(self.jti)
+        if not revocation_group_commit:
+            db.session.add(self)
+            db.session.commit()
+            return
+        # Committed in one batch with revocations from concurrent logouts; returns once this one is durable
+        revocation_writer.add({'jti': self.jti, 'expires_at': self.expires_at})
+
+    @classmethod
+    def insert_many(cls, rows):
+        try:
+            db.session.execute(cls.__table__.insert(), rows)
+            db.session.commit()
+        except:
+            db.session.rollback()
+            raise
 
     @classmethod
     def is_jti_blacklisted(cls, jti):
-        query = cls.query.filter_by(jti=jti).first()
+        # Only a possible hit in the in-memory filter needs a database round trip
+        if not revocation_index.might_contain(jti):
+            return False
+        query = cls.query.filter_by(jti=jti).filter(cls.unexpired()).first()
         return bool(query)
+
+    @classmethod
+    def revoked_since(cls, after_id):
+        return db.session.query(cls.id, cls.jti).filter(cls.id > after_id, cls.unexpired()).order_by(cls.id).all()
+
+    @classmethod
+    def unexpired(cls):
+        return db.or_(cls.expires_at.is_(None), cls.expires_at > datetime.utcnow())
+
+    @classmethod
+    def purge_expired(cls, batch_size=1000):
+        """
+        Deletes revocations whose token has expired, committing after every batch so
+        no single transaction holds locks on more than batch_size rows
+        """
+        now = datetime.utcnow()
+        deleted = 0
+        while True:
+            ids = [row.id for row in db.session.query(cls.id).filter(cls.expires_at < now).limit(batch_size)]
+            if not ids:
+                break
+            cls.query.filter(cls.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            deleted += len(ids)
+        if deleted:
+            revocation_index.reset()
+        return deleted
+
+
+revocation_index = RevocationIndex(loader=RevokedTokenModel.revoked_since)
+revocation_writer = GroupCommit(writer=RevokedTokenModel.insert_many)
+
+
+def upgrade_schema():
+    """
+    Applies schema changes that db.create_all() cannot make to tables that already exist
+    """
+    columns = [column['name'] for column in inspect(db.engine).get_columns('revoked_tokens')]
+    if 'expires_at' not in columns:
+        db.session.execute('ALTER TABLE revoked_tokens ADD COLUMN expires_at TIMESTAMP')
+        # Rows written before expiry was recorded are kept until any token they could match has expired
+        refresh_expires = current_app.config.get('JWT_REFRESH_TOKEN_EXPIRES') or timedelta(days=30)
+        db.session.execute(
+            'UPDATE revoked_tokens SET expires_at = :expires_at WHERE expires_at IS NULL',
+            {'expires_at': datetime.utcnow() + refresh_expires}
+        )
+
+    db.session.execute('CREATE INDEX IF NOT EXISTS ix_revoked_tokens_jti ON revoked_tokens (jti)')
+    db.session.execute('CREATE INDEX IF NOT EXISTS ix_revoked_tokens_expires_at ON revoked_tokens (expires_at)')
+    db.session.commit()
@@ -0,0 +1,195 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from os import environ
+
+from app.api.shared_store import SharedStore
+
+logger = logging.getLogger(__name__)
+
+# Environment Configuration Variables
+prefetch_store_path = environ.get('PREFETCH_STORE_PATH')
+prefetch_in_process = environ.get('PREFETCH_IN_PROCESS', '0') == '1'
+prefetch_interval = float(environ.get('PREFETCH_INTERVAL', 60))
+prefetch_top_k = int(environ.get('PREFETCH_TOP_K', 200))
+prefetch_lead = float(environ.get('PREFETCH_LEAD', 120))              # refresh keys expiring within this many seconds
+prefetch_budget = int(environ.get('PREFETCH_BUDGET', 50))             # upstream refreshes per cycle
+prefetch_quota_reserve = int(environ.get('PREFETCH_QUOTA_RESERVE', 10))  # tokens always left for user requests
+prefetch_decay = float(environ.get('PREFETCH_DECAY', 0.9))             # hit counts are multiplied by this every cycle
+hit_flush_interval = float(environ.get('PREFETCH_FLUSH_INTERVAL', 5))
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS prefetch_hits (
+        endpoint TEXT NOT NULL,
+        key TEXT NOT NULL,
+        hits REAL NOT NULL,
+        last_seen REAL NOT NULL,
+        PRIMARY KEY (endpoint, key)
+    )''',
+    'CREATE INDEX IF NOT EXISTS ix_prefetch_hits_hits ON prefetch_hits (hits)',
+    '''CREATE TABLE IF NOT EXISTS prefetch_lease (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )''',
+)
+
+
+class HitTracker(object):
+    """
+    Counts requests per (endpoint, zipcode) in memory and periodically adds them to
+    the shared store, so request frequency is known across every worker without a
+    write on each request.
+    """
+    def __init__(self, store):
+        self.store = store
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._flushed_at = time.time()
+
+    def record(self, endpoint, key):
+        with self._lock:
+            self._counts[(endpoint, key)] += 1
+        if time.time() - self._flushed_at >= hit_flush_interval:
+            try:
+                self.flush()
+            except Exception:
+                # Runs on the request thread; popularity tracking must never fail a request
+                logger.warning('Flushing prefetch hits failed', exc_info=True)
+
+    def flush(self):
+        """
+        Adds the counts gathered since the last flush to the shared store; on failure they are kept for the next one
+        """
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._flushed_at = time.time()
+        if not counts:
+            return
+        now = time.time()
+        rows = [(endpoint, key) for endpoint, key in counts]
+        try:
+            with self.store.transaction() as conn:
+                # Insert then update rather than an ON CONFLICT upsert, which needs SQLite 3.24
+                conn.executemany(
+                    'INSERT OR IGNORE INTO prefetch_hits (endpoint, key, hits, last_seen) VALUES (?, ?, 0, ?)',
+                    [(endpoint, key, now) for endpoint, key in rows]
+                )
+                conn.executemany(
+                    'UPDATE prefetch_hits SET hits = hits + ?, last_seen = ? WHERE endpoint = ? AND key = ?',
+                    [(counts[(endpoint, key)], now, endpoint, key) for endpoint, key in rows]
+                )
+        except Exception:
+            with self._lock:
+                self._counts.update(counts)
+            raise
+
+    def top(self, limit):
+        return self.store.execute(
+            'SELECT endpoint, key FROM prefetch_hits ORDER BY hits DESC LIMIT ?', (limit,)
+        ).fetchall()
+
+    def decay(self, factor):
+        with self.store.transaction() as conn:
+            conn.execute('UPDATE prefetch_hits SET hits = hits * ?', (factor,))
+            conn.execute('DELETE FROM prefetch_hits WHERE hits < 0.5')
+
+
+class Prefetcher(object):
+    """
+    Refreshes the most requested (endpoint, zipcode) keys shortly before their
+    cached responses expire.
+
+    endpoints maps an endpoint name to (provider, cache endpoint, fetch). Only the
+    process holding the lease runs a cycle, so running one per worker is safe.
+    """
+    def __init__(self, endpoints, tracker, cache, quota):
+        self.endpoints = endpoints
+        self.tracker = tracker
+        self.cache = cache
+        self.quota = quota
+        self.owner = uuid.uuid4().hex
+        self.refreshed = 0
+        self.failed = 0
+
+    def run_forever(self):
+        while True:
+            try:
+                self.tracker.flush()
+                if self._hold_lease():
+                    self.run_cycle()
+            except Exception:
+                logger.warning('Prefetch cycle failed', exc_info=True)
+            time.sleep(prefetch_interval)
+
+    def run_cycle(self):
+        budget = prefetch_budget
+        remaining = self.quota.remaining()
+        for endpoint, key in self.tracker.top(prefetch_top_k):
+            if budget <= 0:
+                break
+            if endpoint not in self.endpoints:
+                continue
+            provider, cache_endpoint, fetch = self.endpoints[endpoint]
+
+            expires_in = self.cache.expires_in(provider, cache_endpoint, key)
+            if expires_in is not None and expires_in > prefetch_lead:
+                continue
+            if remaining.get(provider, {}).get('remaining', budget) <= prefetch_quota_reserve:
+                continue
+
+            budget -= 1
+            if provider in remaining:
+                remaining[provider]['remaining'] -= 1
+            try:
+                self.cache.refresh(provider, cache_endpoint, key, lambda: fetch(key))
+                self.refreshed += 1
+            except Exception:
+                self.failed += 1
+                logger.info('Prefetch of %s %s failed', endpoint, key, exc_info=True)
+        self.tracker.decay(prefetch_decay)
+
+    def _hold_lease(self):
+        now = time.time()
+        with self.tracker.store.transaction() as conn:
+            row = conn.execute('SELECT owner, expires_at FROM prefetch_lease WHERE name = ?', ('prefetch',)).fetchone()
+            if row is not None and row[0] != self.owner and row[1] > now:
+                return False
+            conn.execute(
+                'INSERT OR REPLACE INTO prefetch_lease (name, owner, expires_at) VALUES (?, ?, ?)',
+                ('prefetch', self.owner, now + 3 * prefetch_interval)
+            )
+            return True
+
+
+hit_tracker = HitTracker(SharedStore(prefetch_store_path, SCHEMA))
+
+_started_pid = None
+
+
+def make_prefetcher():
+    from app.api import providers
+    from app.api.quota import quota
+    from app.api.response_cache import response_cache
+    return Prefetcher(providers.PREFETCH_ENDPOINTS, hit_tracker, response_cache, quota)
+
+
+def start_in_background():
+    """
+    Starts the prefetch loop on a daemon thread once per process
+    """
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    _started_pid = os.getpid()
+    thread = threading.Thread(target=make_prefetcher().run_forever, name='prefetch', daemon=True)
+    thread.start()
+
+
+if __name__ == '__main__':
+    # Standalone worker; it must share PREFETCH_STORE_PATH and RESPONSE_CACHE_PATH with the web processes
+    logging.basicConfig(level=logging.INFO)
+    make_prefetcher().run_forever()
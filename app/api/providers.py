@@ -0,0 +1,266 @@
+from os import environ
+
+from app.api import metrics, records, upstream
+from app.api.cache import TTLCache
+from app.api.gazetteer import gazetteer
+from app.api.geotiles import TileIndex
+from app.api.prefetch import hit_tracker
+from app.api.resilience import UpstreamUnavailable
+from app.api.response_cache import response_cache
+
+# Environment Configuration Variables
+open_weather = environ.get('OPEN_WEATHER_KEY')
+zomato = environ.get('ZOMATO_KEY')
+ticketmaster = environ.get('TICKETMASTER_KEY')
+opentrip = environ.get('OPENTRIP_KEY')
+
+# Base URLs, overridable so the benchmark suite can point them at local stand-ins
+open_weather_url = environ.get('OPEN_WEATHER_URL', 'http://api.openweathermap.org/data/2.5')
+zomato_url = environ.get('ZOMATO_URL', 'https://developers.zomato.com/api/v2.1')
+ticketmaster_url = environ.get('TICKETMASTER_URL', 'https://app.ticketmaster.com/discovery/v2')
+opentrip_url = environ.get('OPENTRIP_URL', 'https://api.opentripmap.com/0.1/en')
+
+hotel_tile_limit = int(environ.get('HOTEL_TILE_LIMIT', 500))    # hotels requested per map tile
+
+# Zipcode lookups almost never change, so they are cached per worker
+geocode_cache_size = int(environ.get('GEOCODE_CACHE_SIZE', 4096))
+geocode_cache_ttl = int(environ.get('GEOCODE_CACHE_TTL', 24 * 60 * 60))
+city_details_cache = TTLCache(maxsize=geocode_cache_size, ttl=geocode_cache_ttl)
+city_id_cache = TTLCache(maxsize=geocode_cache_size, ttl=geocode_cache_ttl)
+metrics.registry.register(metrics.cache_collector('city_details', city_details_cache))
+metrics.registry.register(metrics.cache_collector('city_id', city_id_cache))
+
+# 15 miles is 24140 meters
+HOTEL_RADIUS = 24140
+
+
+def get_weather(zipcode):
+    """
+    Requirement 2.0.0: Current weather for a zipcode
+    """
+    hit_tracker.record('weather', zipcode)
+    return response_cache.get_or_fetch('openweather', 'weather', zipcode, lambda: fetch_weather(zipcode))
+
+
+def get_forecast(zipcode):
+    """
+    Requirement 2.2.0: Five day forecast for a zipcode
+    """
+    hit_tracker.record('forecast', zipcode)
+    return response_cache.get_or_fetch('openweather', 'forecast', zipcode, lambda: fetch_forecast(zipcode))
+
+
+def get_fresh(name, zipcodes):
+    """
+    Fresh cached responses of a PREFETCH_ENDPOINTS entry for many zipcodes in one read
+    """
+    provider, endpoint, _ = PREFETCH_ENDPOINTS[name]
+    cached = response_cache.get_many(provider, endpoint, zipcodes)
+    for zipcode in cached:
+        hit_tracker.record(name, zipcode)
+    return cached
+
+
+def get_restaurants(zipcode):
+    """
+    Requirement 3.0.0: Local restaurants for a zipcode
+    """
+    return response_cache.get_or_fetch('zomato', 'search', zipcode, lambda: fetch_restaurants(zipcode))
+
+
+def get_events(zipcode):
+    """
+    Requirement 4.0.0: Local events for a zipcode
+    """
+    hit_tracker.record('events', zipcode)
+    return response_cache.get_or_fetch('ticketmaster', 'events', zipcode, lambda: fetch_events(zipcode))
+
+
+def get_hotels(zipcode):
+    """
+    Requirement 5.0.0: Local hotels for a zipcode
+    """
+    hit_tracker.record('hotels', zipcode)
+    return response_cache.get_or_fetch('opentripmap', 'radius', zipcode, lambda: fetch_hotels(zipcode))
+
+
+def get_hotels_near(lat, lon, radius=HOTEL_RADIUS, sort='distance', limit=None):
+    """
+    Requirement 5.0.0: Hotels within radius meters of a point
+    """
+    return hotel_tiles.radius(lat, lon, radius, sort, limit)
+
+
+def get_hotels_in_bbox(south, west, north, east, sort='distance', limit=None):
+    """
+    Requirement 5.0.0: Hotels inside a bounding box
+    """
+    return hotel_tiles.bbox(south, west, north, east, sort, limit)
+
+
+def get_hotel_info(xid):
+    """
+    Requirement 5.0.0: Address of a single hotel
+    """
+    return response_cache.get_or_fetch('opentripmap', 'xid', xid, lambda: fetch_hotel_info(xid))
+
+
+def fetch_weather(zipcode):
+    url = open_weather_url + '/weather'
+    query_string = {
+        'zip': zipcode,
+        'units': 'imperial',
+        'appid': open_weather
+    }
+    return records.weather(upstream.get_json('openweather', url, params=query_string))
+
+
+def fetch_forecast(zipcode):
+    url = open_weather_url + '/forecast'
+    query_string = {
+        'zip': zipcode,
+        'units': 'imperial',
+        'appid': open_weather
+    }
+    return records.forecast(upstream.get_json('openweather', url, params=query_string))
+
+
+def fetch_restaurants(zipcode):
+    # get city from open weather
+    city_details = get_city_details(zipcode=zipcode)
+
+    # get zomato's city id
+    city_loc_info = city_id_cache.get(zipcode)
+    if city_loc_info is None:
+        city_loc_info = get_city_id(city_details=city_details)
+        if 'error' not in city_loc_info:
+            city_id_cache.set(zipcode, city_loc_info)
+
+    # get list of restaurants from zomato with city id
+    url = zomato_url + '/search'
+    query_string = {
+        'entity_id': city_loc_info['city_id'],
+        'entity_type': city_loc_info['type']
+    }
+    headers = {
+        'user-key': zomato
+    }
+    return records.restaurants(upstream.get_json('zomato', url, params=query_string, headers=headers))
+
+
+def fetch_events(zipcode):
+    url = ticketmaster_url + '/events'
+    query_string = {
+        'apikey': ticketmaster,
+        'postalCode': zipcode
+    }
+    return records.events(upstream.get_json('ticketmaster', url, params=query_string))
+
+
+def fetch_hotels(zipcode):
+    # get city name and lat long from open weather
+    city_details = get_city_details(zipcode)
+
+    # Answered from the tiles around the city, shared with every neighbouring zipcode
+    return hotel_tiles.radius(float(city_details['lat']), float(city_details['lon']), HOTEL_RADIUS)
+
+
+def fetch_hotel_tile(south, west, north, east):
+    url = opentrip_url + '/places/bbox'
+    query_string = {
+        'lon_min': west,
+        'lat_min': south,
+        'lon_max': east,
+        'lat_max': north,
+        'kinds': 'accomodations',
+        'limit': hotel_tile_limit,
+        'apikey': opentrip
+    }
+    return records.hotels(upstream.get_json('opentripmap', url, params=query_string))
+
+
+def fetch_hotel_info(xid):
+    url = f"{opentrip_url}/places/xid/{xid}"
+    query_string = {
+        'apikey': opentrip
+    }
+    response = upstream.get_json('opentripmap', url, params=query_string)
+
+    # Requirement 5.1.0: information contains hotel address
+    return {
+        'house_number': response['address']['house_number'],
+        'street': response['address']['road'],
+        'city': response['address']['city'],
+    }
+
+
+# Endpoints the prefetcher keeps warm: name -> (provider, cache endpoint, fetch)
+PREFETCH_ENDPOINTS = {
+    'weather': ('openweather', 'weather', fetch_weather),
+    'forecast': ('openweather', 'forecast', fetch_forecast),
+    'events': ('ticketmaster', 'events', fetch_events),
+    'hotels': ('opentripmap', 'radius', fetch_hotels)
+}
+
+hotel_tiles = TileIndex('accomodations', fetch_hotel_tile)
+metrics.registry.register(metrics.cache_collector('hotel_tiles', hotel_tiles))
+
+
+# Acquires Zomato API's city ID from lat and long
+@metrics.timed('geocode', step='city_id')
+def get_city_id(city_details):
+    url = zomato_url + '/locations'
+    querystring = {
+        'query': city_details['city'],
+        'lat': city_details['lat'],
+        'lon': city_details['lon']
+    }
+    headers = {
+        'user-key': zomato
+    }
+    try:
+        response = upstream.get_json('zomato', url, params=querystring, headers=headers)
+
+        city_info = {
+            'city_id': response['location_suggestions'][0]['entity_id'],
+            'type': response['location_suggestions'][0]['entity_type']
+        }
+        return city_info
+    except UpstreamUnavailable:
+        raise
+    # Requirement 1.2.0: informs user if no information was found
+    except:
+        return {"error": "no info from get_city_id()"}
+
+
+# Get city name, lat, and long from the offline gazetteer, falling back to Open Weather API
+@metrics.timed('geocode', step='city_details')
+def get_city_details(zipcode):
+    city_details = gazetteer.lookup(zipcode)
+    if city_details is not None:
+        return city_details
+
+    city_details = city_details_cache.get(zipcode)
+    if city_details is not None:
+        return city_details
+
+    url = open_weather_url + '/weather'
+    query_string = {
+        'zip': zipcode,
+        'units': 'imperial',
+        'appid': open_weather
+    }
+    try:
+        response = upstream.get_json('openweather', url, params=query_string)
+        city_details = {
+            'city': response['name'],
+            'lat': response['coord']['lat'],
+            'lon': response['coord']['lon']
+        }
+        city_details_cache.set(zipcode, city_details)
+        return city_details
+    except UpstreamUnavailable:
+        raise
+    # Requirement 1.2.0: informs user if no information was found
+    except:
+        return {"error": "no info from get_city_details"}, 404
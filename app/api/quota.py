@@ -0,0 +1,124 @@
+import time
+from os import environ
+
+from app.api.resilience import UpstreamUnavailable
+from app.api.shared_store import SharedStore
+
+# Requests allowed per window in seconds, from each provider's free tier; override with QUOTA_<PROVIDER>=requests/seconds
+DEFAULT_LIMITS = {
+    'openweather': '60/60',
+    'zomato': '1000/86400',
+    'ticketmaster': '5000/86400',
+    'opentripmap': '10/1',
+    'ipapi': '45/60'
+}
+
+# Environment Configuration Variables
+quota_store_path = environ.get('QUOTA_STORE_PATH')
+quota_max_wait = float(environ.get('QUOTA_MAX_WAIT', 2))
+quota_max_burst = int(environ.get('QUOTA_MAX_BURST', 60))
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS quota_buckets (
+        provider TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )''',
+)
+
+
+class QuotaExceeded(UpstreamUnavailable):
+    """
+    Raised when a provider's budget would not allow a call within the wait limit
+    """
+
+
+class Limit(object):
+    def __init__(self, spec):
+        requests, seconds = spec.split('/')
+        self.requests = int(requests)
+        self.seconds = float(seconds)
+        self.rate = self.requests / self.seconds
+        # Daily budgets refill slowly, so cap how much of one can be spent in a single burst
+        self.burst = max(1, min(self.requests, quota_max_burst))
+
+
+class QuotaManager(object):
+    """
+    One token bucket per provider, kept in the shared SQLite store so that all
+    workers on the host draw from the same budget.
+    """
+    def __init__(self, store=None, limits=None):
+        self.store = store or SharedStore(quota_store_path, SCHEMA)
+        specs = dict(DEFAULT_LIMITS)
+        for provider in specs:
+            override = environ.get('QUOTA_{}'.format(provider.upper()))
+            if override:
+                specs[provider] = override
+        specs.update(limits or {})
+        self.limits = dict((provider, Limit(spec)) for provider, spec in specs.items())
+        self.waited = 0
+        self.rejected = 0
+
+    def acquire(self, provider, max_wait=None):
+        """
+        Takes one token for provider, waiting up to max_wait seconds for the bucket to refill
+        """
+        limit = self.limits.get(provider)
+        if limit is None:
+            return
+
+        deadline = time.time() + (quota_max_wait if max_wait is None else max_wait)
+        while True:
+            wait = self._take(provider, limit)
+            if wait == 0:
+                return
+            if time.time() + wait > deadline:
+                self.rejected += 1
+                raise QuotaExceeded('{} quota exhausted'.format(provider))
+            self.waited += 1
+            time.sleep(wait)
+
+    def _take(self, provider, limit):
+        # Returns 0 once a token was taken, otherwise the seconds until one is available
+        with self.store.transaction() as conn:
+            now = time.time()
+            tokens = self._refill(conn.execute(
+                'SELECT tokens, updated_at FROM quota_buckets WHERE provider = ?', (provider,)
+            ).fetchone(), limit, now)
+
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / limit.rate
+            conn.execute(
+                'INSERT OR REPLACE INTO quota_buckets (provider, tokens, updated_at) VALUES (?, ?, ?)',
+                (provider, tokens, now)
+            )
+            return wait
+
+    @staticmethod
+    def _refill(row, limit, now):
+        if row is None:
+            return float(limit.burst)
+        tokens, updated_at = row
+        return min(float(limit.burst), tokens + (now - updated_at) * limit.rate)
+
+    def remaining(self):
+        now = time.time()
+        rows = dict(
+            (provider, (tokens, updated_at))
+            for provider, tokens, updated_at in self.store.execute('SELECT provider, tokens, updated_at FROM quota_buckets')
+        )
+        budget = {}
+        for provider, limit in sorted(self.limits.items()):
+            budget[provider] = {
+                'remaining': int(self._refill(rows.get(provider), limit, now)),
+                'burst': limit.burst,
+                'limit': '{}/{}s'.format(limit.requests, int(limit.seconds))
+            }
+        return budget
+
+
+quota = QuotaManager()
@@ -0,0 +1,191 @@
+import time
+
+
+class Record(object):
+    """
+    Fixed-field value extracted from a provider payload.
+
+    Slots take about a third of the memory of the equivalent dict, and a record
+    still reads like one (record['city']) so callers need not care which they hold.
+    The encoder in app.api.encoding writes records as JSON objects in slot order.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def as_dict(self):
+        # Subclasses spell theirs out as a dict literal, several times faster than this loop
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.as_dict()
+        return self.as_dict() == other
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__))
+
+
+class Weather(Record):
+    __slots__ = ('city', 'date', 'temperature', 'description')
+
+    def __init__(self, city, date, temperature, description):
+        self.city = city
+        self.date = date
+        self.temperature = temperature
+        self.description = description
+
+    def as_dict(self):
+        return {
+            'city': self.city,
+            'date': self.date,
+            'temperature': self.temperature,
+            'description': self.description
+        }
+
+
+class ForecastPoint(Record):
+    __slots__ = ('city', 'time', 'temperature', 'description')
+
+    def __init__(self, city, time, temperature, description):
+        self.city = city
+        self.time = time
+        self.temperature = temperature
+        self.description = description
+
+    def as_dict(self):
+        return {
+            'city': self.city,
+            'time': self.time,
+            'temperature': self.temperature,
+            'description': self.description
+        }
+
+
+class Restaurant(Record):
+    __slots__ = ('name', 'address', 'phone', 'cuisine', 'price_scale', 'rating')
+
+    def __init__(self, name, address, phone, cuisine, price_scale, rating):
+        self.name = name
+        self.address = address
+        self.phone = phone
+        self.cuisine = cuisine
+        self.price_scale = price_scale
+        self.rating = rating
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'address': self.address,
+            'phone': self.phone,
+            'cuisine': self.cuisine,
+            'price_scale': self.price_scale,
+            'rating': self.rating
+        }
+
+
+class Event(Record):
+    __slots__ = ('name', 'date', 'classifications', 'venue', 'address')
+
+    def __init__(self, name, date, classifications, venue, address):
+        self.name = name
+        self.date = date
+        self.classifications = classifications
+        self.venue = venue
+        self.address = address
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'date': self.date,
+            'classifications': self.classifications,
+            'venue': self.venue,
+            'address': self.address
+        }
+
+
+class Hotel(Record):
+    __slots__ = ('name', 'rating', 'xid', 'lat', 'lon')
+
+    def __init__(self, name, rating, xid, lat, lon):
+        self.name = name
+        self.rating = rating
+        self.xid = xid
+        self.lat = lat
+        self.lon = lon
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'rating': self.rating,
+            'xid': self.xid,
+            'lat': self.lat,
+            'lon': self.lon
+        }
+
+
+def local_time(epoch):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(epoch))
+
+
+# Single-pass extractors: each walks the provider payload once, binding every
+# nested object it reads more than once to a local
+
+def weather(response):
+    # Requirement 2.3.0: information returned contains temperature, description, and date
+    return Weather(response['name'], local_time(response['dt']), response['main']['temp'],
+                   response['weather'][0]['description'])
+
+
+def forecast(response):
+    # Requirement 2.3.0: information returned contains temperature, description, and date
+    city = response['city']['name']
+    return [
+        ForecastPoint(city, local_time(item['dt']), item['main']['temp'], item['weather'][0]['description'])
+        for item in response['list']
+    ]
+
+
+def restaurants(response):
+    # Requirement 3.1.0: information contains name, address, phone, price, cuisines, and rating
+    records = []
+    for item in response['restaurants']:
+        restaurant = item['restaurant']
+        records.append(Restaurant(
+            restaurant['name'], restaurant['location']['address'], restaurant['phone_numbers'],
+            restaurant['cuisines'], restaurant['price_range'], restaurant['user_rating']['aggregate_rating']
+        ))
+    return records
+
+
+def events(response):
+    # Requirement 4.1.0: information contains name, address, type, and date
+    records = []
+    for item in response['_embedded']['events']:
+        # Only the last classification has ever been reported
+        classification = item['classifications'][-1]
+        venue = item['_embedded']['venues'][0]
+        records.append(Event(
+            item['name'],
+            item['dates']['start']['localDate'],
+            [classification['segment']['name'], classification['genre']['name'], classification['subGenre']['name']],
+            venue['name'],
+            venue['address']['line1']
+        ))
+    return records
+
+
+def hotels(response):
+    # Requirement 5.1.0: information contains name and rating
+    records = []
+    for item in response['features']:
+        properties = item['properties']
+        lon, lat = item['geometry']['coordinates'][:2]
+        # xid is unique identifier for an object in open trip map
+        records.append(Hotel(properties['name'], properties['rate'], properties['xid'], lat, lon))
+    return records
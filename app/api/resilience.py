@@ -0,0 +1,136 @@
+import threading
+import time
+from os import environ
+
+# Environment Configuration Variables
+breaker_failure_threshold = int(environ.get('BREAKER_FAILURE_THRESHOLD', 5))
+breaker_reset_timeout = float(environ.get('BREAKER_RESET_TIMEOUT', 30))
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised when a provider could not be reached or answered with a server error
+    """
+
+
+class CircuitOpen(UpstreamUnavailable):
+    """
+    Raised without calling the provider while its circuit breaker is open
+    """
+
+
+class SingleFlight(object):
+    """
+    Collapses concurrent calls for the same key into one; every caller gets its result or exception
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _Call(object):
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling a provider after failure_threshold consecutive failures.
+
+    Once reset_timeout has passed a single probe call is let through (half open);
+    its success closes the breaker and its failure opens it for another timeout.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or breaker_failure_threshold
+        self.reset_timeout = breaker_reset_timeout if reset_timeout is None else reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self._lock = threading.Lock()
+
+    def call(self, func, before=None):
+        """
+        Calls func unless the breaker is open. before, when given, runs once the call is
+        let through and before func; if it raises, nothing reached the provider, so the
+        breaker is left as it was and a probe is handed to the next caller.
+        """
+        with self._lock:
+            probing = False
+            if self.state == self.OPEN:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpen('{} circuit is open'.format(self.name))
+                self.state = self.HALF_OPEN
+                probing = True
+            elif self.state == self.HALF_OPEN:
+                # Another caller is already probing
+                raise CircuitOpen('{} circuit is half open'.format(self.name))
+
+        if before is not None:
+            try:
+                before()
+            except BaseException:
+                if probing:
+                    with self._lock:
+                        if self.state == self.HALF_OPEN:
+                            self.state = self.OPEN
+                raise
+
+        try:
+            result = func()
+        except UpstreamUnavailable:
+            self._record_failure()
+            raise
+        except Exception:
+            # The provider answered; the answer just was not usable
+            self._record_success()
+            raise
+        self._record_success()
+        return result
+
+    def _record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+    def _record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
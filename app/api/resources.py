@@ -1,12 +1,18 @@
 from flask_jwt_extended import (create_access_token, create_refresh_token,
                                 get_jwt_identity, get_raw_jwt,
                                 jwt_refresh_token_required, jwt_required)
+from flask import Response, stream_with_context
 from flask_restful import Resource, reqparse
-from flask import request
+from sqlalchemy.exc import IntegrityError
+from app.api.hashing import HashingBusy
+from app.api.location import get_location_by_ip
 from app.api.models import RevokedTokenModel, UserModel
+from app.api.quota import quota
+from app.api.resilience import UpstreamUnavailable
+from app.api import concurrency, encoding, forecast, geotiles, providers
+from app.api.providers import get_city_details
+from app.run import db
 
-import requests
-import time
 from os import environ
 
 # Argument Parsers
@@ -17,11 +23,37 @@ parser.add_argument('password', help='This field cannot be blank', required=True
 zip_parser = reqparse.RequestParser()
 zip_parser.add_argument('zipcode', required=False)
 
+hotels_parser = zip_parser.copy()
+hotels_parser.add_argument('addresses', type=int, default=0, help='Number of hotels to include addresses for')
+hotels_parser.add_argument('lat', type=float, required=False, help='Latitude to search around instead of a zipcode')
+hotels_parser.add_argument('lon', type=float, required=False, help='Longitude to search around instead of a zipcode')
+hotels_parser.add_argument('radius', type=int, required=False, help='Search radius in meters')
+hotels_parser.add_argument('bbox', required=False, help='Bounding box as south,west,north,east')
+hotels_parser.add_argument('sort', choices=geotiles.SORTS, required=False, help='One of distance or rating')
+hotels_parser.add_argument('limit', type=int, required=False, help='Maximum number of hotels to return')
+
+# zipcode may be repeated (?zipcode=a&zipcode=b) or comma separated (?zipcode=a,b) for a batch
+weather_parser = reqparse.RequestParser()
+weather_parser.add_argument('zipcode', required=False, action='append')
+
+forecast_parser = weather_parser.copy()
+forecast_parser.add_argument('granularity', default='raw', choices=forecast.GRANULARITIES,
+                             help='One of raw, 3h or daily')
+forecast_parser.add_argument('fields', required=False, help='Comma separated fields to return')
+
+users_parser = reqparse.RequestParser()
+users_parser.add_argument('after', type=int, default=0, help='Only list users with a greater id')
+users_parser.add_argument('limit', type=int, required=False, help='Maximum number of users to list')
+
 # Environment Configuration Variables
-open_weather = environ.get('OPEN_WEATHER_KEY')
-zomato = environ.get('ZOMATO_KEY')
-ticketmaster = environ.get('TICKETMASTER_KEY')
-opentrip = environ.get('OPENTRIP_KEY')
+trip_provider_timeout = float(environ.get('TRIP_PROVIDER_TIMEOUT', 8))
+hotel_info_concurrency = int(environ.get('HOTEL_INFO_CONCURRENCY', 8))
+hotel_info_max_batch = int(environ.get('HOTEL_INFO_MAX_BATCH', 100))
+hotel_info_timeout = float(environ.get('HOTEL_INFO_TIMEOUT', 10))
+zipcode_batch_concurrency = int(environ.get('ZIPCODE_BATCH_CONCURRENCY', 8))
+zipcode_max_batch = int(environ.get('ZIPCODE_MAX_BATCH', 50))
+zipcode_batch_timeout = float(environ.get('ZIPCODE_BATCH_TIMEOUT', 10))
+admin_users = set(name.strip() for name in environ.get('ADMIN_USERS', '').split(',') if name.strip())
 
 
 class UserRegistration(Resource):
@@ -38,19 +70,27 @@ class UserRegistration(Resource):
         if user_name.isspace():
             return {'message': 'User name cannot be empty space'}, 422
 
-        # Requirements 6.1.1 and 6.1.2: unique username
-        if UserModel.find_by_username(user_name):
-            return {'message': 'User {} already exists'.format(data['username'])}, 422
-
         # Requirement 6.2.1: encrypts password
-        new_user = UserModel(
-            username=data['username'],
-            password=UserModel.generate_hash(data['password'])
-        )
+        try:
+            new_user = UserModel(
+                username=data['username'],
+                password=UserModel.generate_hash(data['password'])
+            )
+        except HashingBusy:
+            return {'message': 'Server is busy, please try again'}, 503
 
         # Requirement 6.3.0: stores user in database
+        # Requirements 6.1.1 and 6.1.2: the unique constraint on users.username rejects taken names
         try:
             new_user.save_to_db()
+        except IntegrityError:
+            db.session.rollback()
+            return {'message': 'User {} already exists'.format(data['username'])}, 422
+        except:
+            db.session.rollback()
+            return {'message': 'Something went wrong'}, 500
+
+        try:
             access_token = create_access_token(identity=data['username'])
             refresh_token = create_refresh_token(identity=data['username'])
             return {
@@ -74,7 +114,12 @@ class UserLogin(Resource):
         if not current_user:
             return {'message': 'User {} doesn\'t exist'.format(data['username'])}, 404
 
-        if UserModel.verify_hash(data['password'], current_user.password):
+        try:
+            valid = current_user.verify_password(data['password'])
+        except HashingBusy:
+            return {'message': 'Server is busy, please try again'}, 503
+
+        if valid:
             access_token = create_access_token(identity=data['username'])
             refresh_token = create_refresh_token(identity=data['username'])
 
@@ -92,9 +137,9 @@ class UserLogin(Resource):
 class UserLogoutAccess(Resource):
     @jwt_required
     def post(self):
-        jti = get_raw_jwt()['jti']
+        raw_jwt = get_raw_jwt()
         try:
-            revoked_token = RevokedTokenModel(jti=jti)
+            revoked_token = RevokedTokenModel.from_jwt(raw_jwt)
             revoked_token.add()
             return {'message': 'Access token has been revoked'}, 403
         except:
@@ -104,9 +149,9 @@ class UserLogoutAccess(Resource):
 class UserLogoutRefresh(Resource):
     @jwt_refresh_token_required
     def post(self):
-        jti = get_raw_jwt()['jti']
+        raw_jwt = get_raw_jwt()
         try:
-            revoked_token = RevokedTokenModel(jti=jti)
+            revoked_token = RevokedTokenModel.from_jwt(raw_jwt)
             revoked_token.add()
             return {'message': 'Refresh token has been revoked'}, 403
         except:
@@ -114,8 +159,21 @@ class UserLogoutRefresh(Resource):
 
 
 class AllUsers(Resource):
+    """
+    Admin listing of users streamed as NDJSON, one {"id", "username"} object per line.
+    A listing is resumed with after set to the last id received.
+    """
+    @jwt_required
     def get(self):
-        return UserModel.return_all()
+        if get_jwt_identity() not in admin_users:
+            return {'message': 'Admin access required'}, 403
+
+        data = users_parser.parse_args()
+        if data['limit'] is not None and data['limit'] < 1:
+            return {'message': 'limit must be at least 1'}, 422
+
+        users = UserModel.iter_public(after_id=data['after'], limit=data['limit'])
+        return Response(stream_with_context(ndjson_chunks(users)), mimetype='application/x-ndjson')
 
 
 class WeatherResource(Resource):
@@ -124,10 +182,14 @@ class WeatherResource(Resource):
     """
     @jwt_required
     def get(self):
-        data = zip_parser.parse_args()
+        data = weather_parser.parse_args()
+        zipcodes = split_values(data['zipcode'])
+
+        if len(zipcodes) > 1:
+            return get_weather_batch('weather', providers.get_weather, zipcodes, 'weather')
 
         # Requirement 1.0.0: derives location from IP address
-        if data['zipcode'] is None:
+        if not zipcodes:
             try:
                 location = get_location_by_ip()
                 zipcode = str(location['zipcode'])
@@ -135,28 +197,12 @@ class WeatherResource(Resource):
                 return location["error"]
         # Requirement 1.1.0: location zip code is provided by user
         else:
-            zipcode = str(data['zipcode'])
+            zipcode = zipcodes[0]
 
         try:
-            url = 'http://api.openweathermap.org/data/2.5/weather'
-            query_string = {
-                'zip': zipcode,
-                'units': 'imperial',
-                'appid': open_weather
-            }
-            response = requests.request("GET", url, params=query_string).json()
-
-            time_epoch = response['dt']
-            time_datetime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time_epoch))
-
-            # Requirement 2.3.0: information returned contains temperature, description, and date
-            weather_data = {
-                'city': response['name'],
-                'date': time_datetime,
-                'temperature': response['main']['temp'],
-                'description': response['weather'][0]['description']
-            }
-            return weather_data, 200
+            return providers.get_weather(zipcode), 200
+        except UpstreamUnavailable:
+            return {'error': 'The weather provider is unavailable, please try again later'}, 503
         # Requirement 1.2.0: informs user if no information was found
         except:
             return {"error": "No weather information found"}, 404
@@ -168,10 +214,21 @@ class WeatherFiveDayResource(Resource):
     """
     @jwt_required
     def get(self):
-        data = zip_parser.parse_args()
+        data = forecast_parser.parse_args()
+        try:
+            fields = forecast.parse_fields(data['fields'], data['granularity'])
+        except forecast.InvalidFields as e:
+            return {'message': str(e)}, 422
+        zipcodes = split_values(data['zipcode'])
+
+        if len(zipcodes) > 1:
+            return get_weather_batch(
+                'forecast', providers.get_forecast, zipcodes, 'fiveday',
+                lambda five_day: forecast.shape(five_day, data['granularity'], fields)
+            )
 
         # Requirement 1.0.0: derives location from IP address
-        if data['zipcode'] is None:
+        if not zipcodes:
             try:
                 location = get_location_by_ip()
                 zipcode = str(location['zipcode'])
@@ -179,31 +236,12 @@ class WeatherFiveDayResource(Resource):
                 return location["error"]
         # Requirement 1.1.0: location zip code is provided by user
         else:
-            zipcode = str(data['zipcode'])
+            zipcode = zipcodes[0]
 
         try:
-            url = 'http://api.openweathermap.org/data/2.5/forecast'
-            query_string = {
-                'zip': zipcode,
-                'units': 'imperial',
-                'appid': open_weather
-            }
-            response = requests.request("GET", url, params=query_string).json()
-
-            five_day = []
-            for item in response['list']:
-                time_epoch = item['dt']
-                time_datetime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time_epoch))
-
-                # Requirement 2.3.0: information returned contains temperature, description, and date
-                details = {
-                    'city': response['city']['name'],
-                    'time': time_datetime,
-                    'temperature': item['main']['temp'],
-                    'description': item['weather'][0]['description']
-                }
-                five_day.append(details)
-            return five_day, 200
+            return forecast.shape(providers.get_forecast(zipcode), data['granularity'], fields), 200
+        except UpstreamUnavailable:
+            return {'error': 'The weather provider is unavailable, please try again later'}, 503
         # Requirement 1.2.0: informs user if no information was found
         except:
             return{"error": "No weather information found"}, 404
@@ -229,63 +267,16 @@ class RestaurantResource(Resource):
             zipcode = str(data['zipcode'])
 
         try:
-            # get city from open weather
-            city_details = get_city_details(zipcode=zipcode)
-
-            # get zomato's city id
-            city_loc_info = self.get_city_id(city_details=city_details)
-
-            # get list of restaurants from zomato with city id
-            url = 'https://developers.zomato.com/api/v2.1/search'
-            query_string = {
-                'entity_id': city_loc_info['city_id'],
-                'entity_type': city_loc_info['type']
-            }
-            headers = {
-                'user-key': zomato
-            }
-            response = requests.request("GET", url, headers=headers, params=query_string).json()
-
-            restaurant_list = []
-
-            # Requirement 3.1.0: information contains name, address, phone, price, cuisines, and rating
-            for item in response['restaurants']:
-                restaurant = {
-                    'name': item['restaurant']['name'],
-                    'address': item['restaurant']['location']['address'],
-                    'phone': item['restaurant']['phone_numbers'],
-                    'cuisine': item['restaurant']['cuisines'],
-                    'price_scale': item['restaurant']['price_range'],
-                    'rating': item['restaurant']['user_rating']['aggregate_rating']
-                }
-                restaurant_list.append(restaurant)
-            return restaurant_list, 200
+            return providers.get_restaurants(zipcode), 200
+        except UpstreamUnavailable:
+            return {'error': 'The restaurant provider is unavailable, please try again later'}, 503
         # Requirement 1.2.0: informs user if no information was found
         except:
             return {"error": "No restaurant information found"}, 404
 
     # Acquires Zomato API's city ID from lat and long
     def get_city_id(self, city_details):
-        url = 'https://developers.zomato.com/api/v2.1/locations'
-        querystring = {
-            'query': city_details['city'],
-            'lat': city_details['lat'],
-            'lon': city_details['lon']
-        }
-        headers = {
-            'user-key': zomato
-        }
-        try:
-            response = requests.request("GET", url, headers=headers, params=querystring).json()
-
-            city_info = {
-                'city_id': response['location_suggestions'][0]['entity_id'],
-                'type': response['location_suggestions'][0]['entity_type']
-            }
-            return city_info
-        # Requirement 1.2.0: informs user if no information was found
-        except:
-            return {"error": "no info from get_city_id()"}
+        return providers.get_city_id(city_details)
 
 
 class EventResource(Resource):
@@ -308,37 +299,9 @@ class EventResource(Resource):
             zipcode = str(data['zipcode'])
 
         try:
-            url = 'https://app.ticketmaster.com/discovery/v2/events'
-            query_string = {
-                'apikey': ticketmaster,
-                'postalCode': zipcode
-            }
-
-            event_list = []
-            response = requests.request("GET", url, params=query_string).json()
-
-            # Requirement 4.1.0: information contains name, address, type, and date
-            for item in response['_embedded']['events']:
-                classifications = []
-
-                for classification in item['classifications']:
-                    class_type = classification['segment']['name']
-                    genre = classification['genre']['name']
-                    subgenre = classification['subGenre']['name']
-
-                classifications.append(class_type)
-                classifications.append(genre)
-                classifications.append(subgenre)
-
-                event = {
-                    'name': item['name'],
-                    'date': item['dates']['start']['localDate'],
-                    'classifications': classifications,
-                    'venue': item['_embedded']['venues'][0]['name'],
-                    'address': item['_embedded']['venues'][0]['address']['line1']
-                }
-                event_list.append(event)
-            return event_list
+            return providers.get_events(zipcode)
+        except UpstreamUnavailable:
+            return {'error': 'The event provider is unavailable, please try again later'}, 503
         # Requirement 1.2.0: informs user if no information was found
         except:
             return {'error': 'No event information found'}, 404
@@ -348,6 +311,111 @@ class HotelResource(Resource):
     """
     Requirement 5.0.0: Provides information on local hotels by IP lookup or zip code entry
     """
+    @jwt_required
+    def get(self):
+        data = hotels_parser.parse_args()
+        sort, limit = data['sort'] or 'distance', data['limit']
+        if limit is not None and limit < 1:
+            return {'message': 'limit must be at least 1'}, 422
+
+        try:
+            # Hotels in an area or around a point are answered from the tile index
+            if data['bbox'] is not None:
+                try:
+                    south, west, north, east = [float(value) for value in data['bbox'].split(',')]
+                except ValueError:
+                    return {'message': 'bbox must be four numbers: south,west,north,east'}, 422
+                hotel_list = providers.get_hotels_in_bbox(south, west, north, east, sort, limit)
+            elif data['lat'] is not None or data['lon'] is not None:
+                if data['lat'] is None or data['lon'] is None:
+                    return {'message': 'lat and lon must be given together'}, 422
+                hotel_list = providers.get_hotels_near(
+                    data['lat'], data['lon'], data['radius'] or providers.HOTEL_RADIUS, sort, limit)
+            else:
+                # Requirement 1.0.0: derives location from IP address
+                if data['zipcode'] is None:
+                    try:
+                        location = get_location_by_ip()
+                        zipcode = str(location['zipcode'])
+                    except:
+                        return location["error"]
+                # Requirement 1.1.0: location zip code is provided by user
+                else:
+                    zipcode = str(data['zipcode'])
+
+                if data['radius'] is None:
+                    hotel_list = geotiles.order(providers.get_hotels(zipcode), sort, limit)
+                else:
+                    city_details = get_city_details(zipcode)
+                    hotel_list = providers.get_hotels_near(
+                        float(city_details['lat']), float(city_details['lon']), data['radius'], sort, limit)
+        except geotiles.InvalidArea as e:
+            return {'message': str(e)}, 422
+        except UpstreamUnavailable:
+            return {'error': 'The hotel provider is unavailable, please try again later'}, 503
+        # Requirement 1.2.0: informs user if no information was found
+        except:
+            return {'error': 'No hotel information found'}, 404
+
+        # Optionally inline addresses for the first N hotels to save a /hotel call per hotel
+        inline = min(max(data['addresses'] or 0, 0), hotel_info_max_batch)
+        if inline:
+            xids = [hotel['xid'] for hotel in hotel_list[:inline]]
+            addresses, _ = get_hotel_infos(xids)
+            hotel_list = [
+                dict(hotel, address=addresses[hotel['xid']]) if hotel['xid'] in addresses else hotel
+                for hotel in hotel_list
+            ]
+        return hotel_list
+
+
+class HotelInfoResource(Resource):
+    """
+    Requirement 5.0.0: Provides information on a specified hotel, or on several hotels at once
+    """
+    @jwt_required
+    def get(self):
+        hotel_id_parser = reqparse.RequestParser()
+        hotel_id_parser.add_argument('xid', help='This field cannot be blank', required=True, action='append')
+
+        data = hotel_id_parser.parse_args()
+        # xid may be repeated (?xid=a&xid=b) or comma separated (?xid=a,b)
+        hotel_ids = split_values(data['xid'])
+
+        if len(hotel_ids) == 1:
+            try:
+                return providers.get_hotel_info(hotel_ids[0])
+            except UpstreamUnavailable:
+                return {'error': 'The hotel provider is unavailable, please try again later'}, 503
+            # Requirement 1.2.0: informs user if no information was found
+            except:
+                return {'error': 'No  hotel information found'}, 404
+
+        if len(hotel_ids) > hotel_info_max_batch:
+            return {'error': 'At most {} hotels can be requested at once'.format(hotel_info_max_batch)}, 422
+
+        hotels, errors = get_hotel_infos(hotel_ids)
+        # Requirement 1.2.0: informs user if no information was found
+        if not hotels:
+            return {'error': 'No  hotel information found'}, 404
+        return {
+            'hotels': hotels,
+            'errors': dict((xid, 'No hotel information found') for xid in errors)
+        }
+
+
+class TripResource(Resource):
+    """
+    Requirements 2.0.0 - 5.0.0: Weather, forecast, restaurants, events and hotels for one location
+    """
+    errors = {
+        'weather': 'No weather information found',
+        'fiveday': 'No weather information found',
+        'restaurants': 'No restaurant information found',
+        'events': 'No event information found',
+        'hotels': 'No hotel information found'
+    }
+
     @jwt_required
     def get(self):
         data = zip_parser.parse_args()
@@ -363,68 +431,40 @@ class HotelResource(Resource):
         else:
             zipcode = str(data['zipcode'])
 
-        try:
-            # get city name and lat long from open weather
-            city_details = get_city_details(zipcode)
-
-            url = 'https://api.opentripmap.com/0.1/en/places/radius'
-            query_string = {
-                # 15 miles is 24140 meters
-                'radius': 24140,
-                'lon': city_details['lon'],
-                'lat': city_details['lat'],
-                'kinds': 'accomodations',
-                'apikey': opentrip
-            }
-            hotel_list = []
-            response = requests.request("GET", url, params=query_string).json()
-
-            # Requirement 5.1.0: information contains name and rating
-            for item in response['features']:
-                hotel = {
-                    'name': item['properties']['name'],
-                    'rating': item['properties']['rate'],
-                    'xid': item['properties']['xid']    # xid is unique identifier for an object in open trip map
-                }
+        # Geocode once; restaurants and hotels wait for it and then read it from cache
+        city_details = concurrency.submit(get_city_details, zipcode)
+
+        def after_geocoding(fetch):
+            def task():
+                city_details.result()
+                return fetch(zipcode)
+            return task
 
-                hotel_list.append(hotel)
+        results, errors = concurrency.gather({
+            'weather': lambda: providers.get_weather(zipcode),
+            'fiveday': lambda: providers.get_forecast(zipcode),
+            'restaurants': after_geocoding(providers.get_restaurants),
+            'events': lambda: providers.get_events(zipcode),
+            'hotels': after_geocoding(providers.get_hotels)
+        }, default_timeout=trip_provider_timeout)
 
-            return hotel_list
         # Requirement 1.2.0: informs user if no information was found
-        except:
-            return {'error': 'No hotel information found'}, 404
+        if not results:
+            return {'error': 'No trip information found'}, 404
 
+        trip = {'zipcode': zipcode}
+        trip.update(results)
+        trip['errors'] = dict((name, self.errors[name]) for name in errors)
+        return trip, 200
 
-class HotelInfoResource(Resource):
+
+class QuotaResource(Resource):
     """
-    Requirement 5.0.0: Provides information on a specified hotel
+    Reports the upstream request budget left for each provider
     """
     @jwt_required
     def get(self):
-        hotel_id_parser = reqparse.RequestParser()
-        hotel_id_parser.add_argument('xid', help='This field cannot be blank', required=True)
-
-        data = hotel_id_parser.parse_args()
-        hotel_id = data['xid']
-
-        try:
-            url = f"https://api.opentripmap.com/0.1/en/places/xid/{hotel_id}"
-            query_string = {
-                'apikey': opentrip
-            }
-            response = requests.request("GET", url, params=query_string).json()
-
-            # Requirement 5.1.0: information contains hotel address
-            hotel_info = {
-                'house_number': response['address']['house_number'],
-                'street': response['address']['road'],
-                'city': response['address']['city'],
-            }
-
-            return hotel_info
-        # Requirement 1.2.0: informs user if no information was found
-        except:
-            return {'error': 'No  hotel information found'}, 404
+        return quota.remaining(), 200
 
 
 class TokenRefresh(Resource):
@@ -438,49 +478,61 @@ class TokenRefresh(Resource):
         return {'access_token': access_token}
 
 
-# Get city name, lat, and long from Open Weather API
-def get_city_details(zipcode):
-    url = 'http://api.openweathermap.org/data/2.5/weather'
-    query_string = {
-        'zip': zipcode,
-        'units': 'imperial',
-        'appid': open_weather
-    }
-    try:
-        response = requests.request("GET", url, params=query_string).json()
-        city_details = {
-            'city': response['name'],
-            'lat': response['coord']['lat'],
-            'lon': response['coord']['lon']
-        }
-        return city_details
-    # Requirement 1.2.0: informs user if no information was found
-    except:
-        return {"error": "no info from get_city_details"}, 404
+def ndjson_chunks(rows, rows_per_chunk=100):
+    """
+    Encodes rows as NDJSON, a chunk of lines at a time so the server does not write once per row
+    """
+    lines = []
+    for row in rows:
+        lines.append(encoding.dumps(row))
+        if len(lines) >= rows_per_chunk:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
 
 
-def get_location_by_ip():
+def split_values(values):
     """
-    Requirement 1.0.0: Find location by user IP address
+    Distinct non-blank values of a repeated, comma separated query argument, in order
     """
-    try:
-        ip_address = ''
-        if 'HTTP_X_FORWARDED_FOR' in request.environ:
-            ip_addrs = request.environ['HTTP_X_FORWARDED_FOR'].split(',')
-            ip_address = ip_addrs[len(ip_addrs)-1]
-        else:
-            ip_address = request.remote_addr
-        response = requests.get("http://ip-api.com/json/{}".format(ip_address))
-        js = response.json()
-        location = {
-            'ipaddr': js['query'],
-            'city': js['city'],
-            'country': js['country'],
-            'zipcode': js['zip']
-        }
-        return location
+    return list(dict.fromkeys(item.strip() for value in values or [] for item in value.split(',') if item.strip()))
+
+
+def get_weather_batch(name, get, zipcodes, key, shape=None):
+    """
+    Answers weather or forecasts for a batch of zipcodes in one response: fresh cache
+    entries are read at once and the rest fetched concurrently, each failure reported
+    under errors
+    """
+    if len(zipcodes) > zipcode_max_batch:
+        return {'error': 'At most {} zipcodes can be requested at once'.format(zipcode_max_batch)}, 422
+
+    cached = providers.get_fresh(name, zipcodes)
+    fetched, failures = concurrency.map_bounded(
+        get, [zipcode for zipcode in zipcodes if zipcode not in cached], zipcode_batch_concurrency,
+        timeout=zipcode_batch_timeout
+    )
+    cached.update(fetched)
+    results = dict((zipcode, shape(cached[zipcode]) if shape else cached[zipcode])
+                   for zipcode in zipcodes if zipcode in cached)
+
+    unavailable = 'The weather provider is unavailable, please try again later'
+    errors = dict(
+        (zipcode, unavailable if isinstance(failures[zipcode], (UpstreamUnavailable, TimeoutError))
+         else 'No weather information found')
+        for zipcode in zipcodes if zipcode in failures
+    )
     # Requirement 1.2.0: informs user if no information was found
-    except Exception as e:
-        return {
-            "error": "unknown location for IP: {0}".format(request.remote_addr)
-        }
+    if not results:
+        if all(message == unavailable for message in errors.values()):
+            return {'error': unavailable}, 503
+        return {'error': 'No weather information found'}, 404
+    return {key: results, 'errors': errors}
+
+
+def get_hotel_infos(xids):
+    """
+    Fetches addresses for many hotels concurrently, de-duplicated and read through the response cache
+    """
+    return concurrency.map_bounded(providers.get_hotel_info, xids, hotel_info_concurrency, timeout=hotel_info_timeout)
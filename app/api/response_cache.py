@@ -0,0 +1,187 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+
+from app.api import encoding, metrics
+from app.api.resilience import UpstreamUnavailable
+from app.api.shared_store import SharedStore
+
+logger = logging.getLogger(__name__)
+
+# Seconds a provider response is served as fresh; override with CACHE_TTL_<PROVIDER>
+DEFAULT_TTLS = {
+    'openweather': 10 * 60,
+    'zomato': 6 * 60 * 60,
+    'ticketmaster': 60 * 60,
+    'opentripmap': 24 * 60 * 60
+}
+
+# Environment Configuration Variables
+response_cache_path = environ.get('RESPONSE_CACHE_PATH')
+refresh_workers = int(environ.get('RESPONSE_CACHE_REFRESH_WORKERS', 4))
+refresh_lease = int(environ.get('RESPONSE_CACHE_REFRESH_LEASE', 30))
+retain_seconds = int(environ.get('RESPONSE_CACHE_RETAIN', 24 * 60 * 60))  # kept past stale as an outage fallback
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS response_cache (
+        cache_key TEXT PRIMARY KEY,
+        provider TEXT NOT NULL,
+        value TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        fresh_until REAL NOT NULL,
+        stale_until REAL NOT NULL,
+        refreshing_until REAL
+    )''',
+    'CREATE INDEX IF NOT EXISTS ix_response_cache_stale_until ON response_cache (stale_until)',
+)
+
+
+class ResponseCache(object):
+    """
+    Provider response cache shared by all workers through a SQLite file.
+
+    Entries are fresh for the provider TTL and then stale for as long again. A stale
+    hit is returned immediately while exactly one worker, the one that wins the
+    refresh lease, fetches a new copy in the background. Older entries are only
+    served when the provider is unavailable.
+    """
+    def __init__(self, store=None, ttls=None):
+        self.store = store or SharedStore(response_cache_path, SCHEMA)
+        self.ttls = dict(DEFAULT_TTLS)
+        for provider in self.ttls:
+            override = environ.get('CACHE_TTL_{}'.format(provider.upper()))
+            if override:
+                self.ttls[provider] = int(override)
+        self.ttls.update(ttls or {})
+        self.hits = 0
+        self.stale_hits = 0
+        self.fallback_hits = 0
+        self.misses = 0
+        self._executor = None
+        self._executor_pid = None
+        self._writes = 0
+
+    @staticmethod
+    def make_key(provider, endpoint, key):
+        return '{}:{}:{}'.format(provider, endpoint, key)
+
+    def get_or_fetch(self, provider, endpoint, key, fetch):
+        """
+        Returns the cached value for (provider, endpoint, key), calling fetch() on a miss.
+        Exceptions raised by fetch() propagate and nothing is cached.
+        """
+        cache_key = self.make_key(provider, endpoint, key)
+        now = time.time()
+        row = self.store.execute(
+            'SELECT value, fresh_until, stale_until FROM response_cache WHERE cache_key = ?',
+            (cache_key,)
+        ).fetchone()
+
+        if row is not None:
+            value, fresh_until, stale_until = row
+            if now < fresh_until:
+                self.hits += 1
+                return encoding.loads(value)
+            if now < stale_until:
+                self.stale_hits += 1
+                if self._claim_refresh(cache_key, now):
+                    self._refresh_in_background(provider, cache_key, fetch)
+                return encoding.loads(value)
+
+        self.misses += 1
+        try:
+            value = fetch()
+        except UpstreamUnavailable:
+            # An expired copy beats an error while the provider is down
+            if row is None:
+                raise
+            self.fallback_hits += 1
+            return encoding.loads(row[0])
+        self.set(provider, cache_key, value)
+        return value
+
+    def get_many(self, provider, endpoint, keys):
+        """
+        Returns {key: value} for every key with a fresh entry, read in one query.
+        Stale and missing keys are left out for the caller to get_or_fetch.
+        """
+        by_cache_key = dict((self.make_key(provider, endpoint, key), key) for key in keys)
+        if not by_cache_key:
+            return {}
+        rows = self.store.execute(
+            'SELECT cache_key, value FROM response_cache WHERE cache_key IN ({}) AND fresh_until > ?'.format(
+                ', '.join('?' * len(by_cache_key))),
+            list(by_cache_key) + [time.time()]
+        )
+        found = dict((by_cache_key[cache_key], encoding.loads(value)) for cache_key, value in rows)
+        self.hits += len(found)
+        return found
+
+    def expires_in(self, provider, endpoint, key):
+        """
+        Returns the seconds until the entry stops being fresh, or None when it is not cached
+        """
+        row = self.store.execute(
+            'SELECT fresh_until FROM response_cache WHERE cache_key = ?',
+            (self.make_key(provider, endpoint, key),)
+        ).fetchone()
+        return None if row is None else row[0] - time.time()
+
+    def refresh(self, provider, endpoint, key, fetch):
+        value = fetch()
+        self.set(provider, self.make_key(provider, endpoint, key), value)
+        return value
+
+    def set(self, provider, cache_key, value):
+        now = time.time()
+        ttl = self.ttls.get(provider, 60)
+        self.store.execute(
+            '''INSERT OR REPLACE INTO response_cache
+               (cache_key, provider, value, fetched_at, fresh_until, stale_until, refreshing_until)
+               VALUES (?, ?, ?, ?, ?, ?, NULL)''',
+            (cache_key, provider, encoding.dumps(value), now, now + ttl, now + 2 * ttl)
+        )
+        self._writes += 1
+        if self._writes % 500 == 0:
+            self.prune()
+
+    def prune(self):
+        self.store.execute('DELETE FROM response_cache WHERE stale_until < ?', (time.time() - retain_seconds,))
+
+    def _claim_refresh(self, cache_key, now):
+        # Only the worker whose UPDATE matches the row gets to refresh it
+        cursor = self.store.execute(
+            '''UPDATE response_cache SET refreshing_until = ?
+               WHERE cache_key = ? AND (refreshing_until IS NULL OR refreshing_until < ?)''',
+            (now + refresh_lease, cache_key, now)
+        )
+        return cursor.rowcount == 1
+
+    def _refresh_in_background(self, provider, cache_key, fetch):
+        if self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=refresh_workers)
+            self._executor_pid = os.getpid()
+
+        def refresh():
+            try:
+                self.set(provider, cache_key, fetch())
+            except Exception:
+                logger.warning('Background refresh failed for %s', cache_key, exc_info=True)
+
+        self._executor.submit(refresh)
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'fallback_hits': self.fallback_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits + self.stale_hits) / lookups if lookups else 0.0
+        }
+
+
+response_cache = ResponseCache()
+metrics.registry.register(metrics.cache_collector('response', response_cache))
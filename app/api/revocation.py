@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from os import environ
+
+logger = logging.getLogger(__name__)
+
+# Environment Configuration Variables
+revocation_capacity = int(environ.get('REVOCATION_FILTER_CAPACITY', 100000))
+revocation_error_rate = float(environ.get('REVOCATION_FILTER_ERROR_RATE', 0.001))
+revocation_sync_interval = float(environ.get('REVOCATION_SYNC_INTERVAL', 1))
+revocation_rebuild_interval = float(environ.get('REVOCATION_REBUILD_INTERVAL', 60 * 60))
+revocation_sync_overlap = int(environ.get('REVOCATION_SYNC_OVERLAP', 1000))        # ids re-read behind the newest seen
+revocation_group_commit = environ.get('REVOCATION_GROUP_COMMIT', '1') == '1'     # 0 commits each revocation alone
+revocation_batch_size = int(environ.get('REVOCATION_BATCH_SIZE', 100))
+
+
+class BloomFilter(object):
+    """
+    Fixed size set membership filter. Never returns a false negative, and returns
+    a false positive at roughly error_rate once capacity items have been added.
+    """
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationIndex(object):
+    """
+    Per-worker negative lookup in front of the revoked_tokens table.
+
+    loader(after_id) must return (id, jti) pairs with id > after_id in ascending order.
+    Revocations made by this worker are added immediately; those made by other
+    workers are picked up by an incremental sync at most every sync_interval
+    seconds. Ids are handed out at insert but become visible at commit, so a row
+    can appear below the newest id already synced; each sync therefore re-reads
+    the last `overlap` ids as well. A miss means the jti is definitely not revoked,
+    so only possible hits need to be confirmed against the database. The filter is
+    rebuilt every rebuild_interval seconds so purged and expired revocations drop
+    out of it.
+    """
+    def __init__(self, loader, capacity=None, error_rate=None, sync_interval=None, rebuild_interval=None,
+                 overlap=None):
+        self.loader = loader
+        self.capacity = capacity or revocation_capacity
+        self.error_rate = error_rate or revocation_error_rate
+        self.sync_interval = revocation_sync_interval if sync_interval is None else sync_interval
+        self.rebuild_interval = revocation_rebuild_interval if rebuild_interval is None else rebuild_interval
+        self.overlap = revocation_sync_overlap if overlap is None else overlap
+        self._filter = BloomFilter(self.capacity, self.error_rate)
+        self._last_id = 0
+        self._window = set()   # ids inside the overlap, so re-reading them does not count them twice
+        self._synced_at = 0
+        self._built_at = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, jti):
+        with self._lock:
+            self._filter.add(jti)
+
+    def might_contain(self, jti):
+        if time.time() - self._synced_at >= self.sync_interval:
+            # One caller syncs while the rest go on with the current filter; only before
+            # the first load, when the filter knows nothing yet, do they wait for it
+            if self._lock.acquire(self._synced_at == 0):
+                try:
+                    if time.time() - self._synced_at >= self.sync_interval:
+                        self._sync()
+                finally:
+                    self._lock.release()
+        return jti in self._filter
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def reset(self):
+        """
+        Reloads the table from scratch on the next lookup, e.g. after revocations were purged
+        """
+        with self._lock:
+            self._synced_at = 0
+            self._built_at = 0
+
+    def _sync(self):
+        if time.time() - self._built_at >= self.rebuild_interval:
+            self._replace()
+            self._built_at = time.time()
+        else:
+            self._last_id, self._window = self._load(
+                self._filter, self._window, self._last_id, max(0, self._last_id - self.overlap))
+        if self._filter.count > self.capacity:
+            # Past capacity the false positive rate climbs, so grow and reload
+            while self.capacity < self._filter.count:
+                self.capacity *= 2
+            self._replace()
+        self._synced_at = time.time()
+
+    def _replace(self):
+        # Built aside and swapped in whole, so lookups never see a half loaded filter
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        last_id, window = self._load(bloom, set(), 0, 0)
+        self._filter, self._last_id, self._window = bloom, last_id, window
+
+    def _load(self, bloom, window, last_id, after_id):
+        for row_id, jti in self.loader(after_id):
+            if row_id in window:
+                continue
+            bloom.add(jti)
+            window.add(row_id)
+            last_id = max(last_id, row_id)
+        floor = last_id - self.overlap
+        return last_id, set(row_id for row_id in window if row_id > floor)
+
+
+class GroupCommit(object):
+    """
+    Writes rows in batches through writer(rows) without acknowledging any row
+    before it is durable.
+
+    add(row) returns only once the batch holding row has been written. A caller
+    that finds no write in progress writes every row queued so far, up to
+    batch_size; rows added meanwhile queue behind that write and go out together
+    in the next one. A lone logout therefore commits at once, while concurrent
+    logouts share one executemany and one commit. A failed write raises in every
+    caller whose row it held.
+    """
+    def __init__(self, writer, batch_size=None):
+        self.writer = writer
+        self.batch_size = batch_size or revocation_batch_size
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self._queue = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def add(self, row):
+        pending = _Pending(row)
+        with self._lock:
+            self._queue.append(pending)
+        while not pending.done:
+            with self._write_lock:
+                if not pending.done:
+                    self._write_batch()
+        if pending.error is not None:
+            raise pending.error
+
+    def _write_batch(self):
+        with self._lock:
+            batch = self._queue[:self.batch_size]
+            del self._queue[:self.batch_size]
+        if not batch:
+            return
+        try:
+            self.writer([pending.row for pending in batch])
+        except Exception as e:
+            self.failed += 1
+            logger.warning('Writing %s revocation(s) failed', len(batch), exc_info=True)
+            for pending in batch:
+                pending.error = e
+        else:
+            self.batches += 1
+            self.written += len(batch)
+        finally:
+            for pending in batch:
+                pending.done = True
+
+
+class _Pending(object):
+    __slots__ = ('row', 'done', 'error')
+
+    def __init__(self, row):
+        self.row = row
+        self.done = False
+        self.error = None
@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from os import environ
+
+# Environment Configuration Variables
+default_path = environ.get('SHARED_STORE_PATH', os.path.join(tempfile.gettempdir(), 'trippy_shared.sqlite3'))
+
+
+class SharedStore(object):
+    """
+    SQLite file shared by every gunicorn worker on the host.
+
+    WAL mode lets readers run alongside the single writer, so lookups stay a local
+    file read. Connections are opened per thread and per pid because sqlite3
+    handles must not cross threads or survive a fork. Under gevent threading.local
+    is per greenlet, which would mean a connection per request, so there each
+    process keeps one connection and a lock keeps greenlets out of each other's
+    transactions.
+    """
+    def __init__(self, path=None, schema=()):
+        self.path = path or default_path
+        self.schema = schema
+        self._local = threading.local()
+        self._ready = False
+        self._lock = threading.Lock()
+        self._shared = None
+        self._shared_lock = None
+        self._shared_pid = None
+
+    def connection(self):
+        pid = os.getpid()
+        if greenlets():
+            if self._shared_pid != pid:
+                # Every greenlet runs on this one thread; the lock serialises their use
+                conn = self._connect(check_same_thread=False)
+                with self._lock:
+                    if self._shared_pid != pid:
+                        self._shared, self._shared_lock, self._shared_pid = conn, threading.RLock(), pid
+                        conn = None
+                if conn is not None:
+                    conn.close()
+            return self._shared
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == pid:
+            return conn
+        conn = self._connect()
+        self._local.conn = conn
+        self._local.pid = pid
+        return conn
+
+    def _connect(self, check_same_thread=True):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=check_same_thread)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with self._lock:
+            if not self._ready:
+                for statement in self.schema:
+                    conn.execute(statement)
+                self._ready = True
+        return conn
+
+    def execute(self, sql, params=()):
+        conn = self.connection()
+        if conn is not self._shared:
+            return conn.execute(sql, params)
+        with self._shared_lock:
+            return conn.execute(sql, params)
+
+    def transaction(self):
+        """
+        Returns a context manager holding the database write lock until it exits
+        """
+        conn = self.connection()
+        return _Transaction(conn, self._shared_lock if conn is self._shared else None)
+
+
+def greenlets():
+    """
+    True when gevent has patched threading, so threads are greenlets sharing one OS thread
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+class _Transaction(object):
+    def __init__(self, conn, lock=None):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            self.conn.execute('BEGIN IMMEDIATE')
+        except BaseException:
+            self._release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.conn.execute('COMMIT')
+            else:
+                self.conn.execute('ROLLBACK')
+        finally:
+            self._release()
+        return False
+
+    def _release(self):
+        if self.lock is not None:
+            self.lock.release()
@@ -0,0 +1,123 @@
+import os
+import threading
+from os import environ
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.api import metrics
+from app.api.quota import quota
+from app.api.resilience import CircuitBreaker, SingleFlight, UpstreamUnavailable
+
+# Environment Configuration Variables
+pool_connections = int(environ.get('UPSTREAM_POOL_CONNECTIONS', 10))  # number of hosts kept pooled
+pool_maxsize = int(environ.get('UPSTREAM_POOL_MAXSIZE', 20))          # keep-alive connections per host
+connect_timeout = float(environ.get('UPSTREAM_CONNECT_TIMEOUT', 3.05))
+read_timeout = float(environ.get('UPSTREAM_READ_TIMEOUT', 10))
+retry_total = int(environ.get('UPSTREAM_RETRIES', 2))
+retry_backoff = float(environ.get('UPSTREAM_RETRY_BACKOFF', 0.3))
+
+_local = threading.local()
+_lock = threading.Lock()
+_sessions = {}
+_breakers = {}
+flights = SingleFlight()
+
+
+def _build_session():
+    # A read timeout is not retried: it would repeat a wait of read_timeout against a
+    # provider that is already slow, past the deadlines callers give each call
+    retry = Retry(
+        total=retry_total,
+        connect=retry_total,
+        read=0,
+        backoff_factor=retry_backoff,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    """
+    Returns the pooled session for the current process.
+
+    urllib3 pools are thread safe, so every thread in a worker shares one session.
+    Sessions are keyed by pid so a gunicorn worker forked from a preloaded master
+    never reuses sockets that were opened by its parent.
+    """
+    pid = os.getpid()
+    session = getattr(_local, 'session', None)
+    if session is not None and _local.pid == pid:
+        return session
+
+    with _lock:
+        if pid not in _sessions:
+            _sessions.clear()
+            _sessions[pid] = _build_session()
+        _local.session = _sessions[pid]
+        _local.pid = pid
+    return _local.session
+
+
+def get(url, params=None, headers=None, timeout=None):
+    """
+    Issues a GET through the shared session with connect and read timeouts applied
+    """
+    if timeout is None:
+        timeout = (connect_timeout, read_timeout)
+    return get_session().get(url, params=params, headers=headers, timeout=timeout)
+
+
+def breaker(provider):
+    """
+    Returns the circuit breaker guarding provider in this process
+    """
+    if provider not in _breakers:
+        with _lock:
+            _breakers.setdefault(provider, CircuitBreaker(provider))
+    return _breakers[provider]
+
+
+def get_json(provider, url, params=None, headers=None):
+    """
+    GETs url and returns the decoded JSON body.
+
+    Identical concurrent requests share one upstream call. Calls to a provider whose
+    breaker is open fail fast with CircuitOpen without spending quota; any other call
+    first takes a token from the provider's quota, raising QuotaExceeded if none frees
+    up in time, which does not count against the breaker. Connection errors,
+    timeouts, 429s and 5xx responses raise UpstreamUnavailable and do.
+    """
+    key = (url, tuple(sorted((params or {}).items())), tuple(sorted((headers or {}).items())))
+
+    def acquire():
+        with metrics.span('quota', provider=provider):
+            quota.acquire(provider)
+
+    def call():
+        return breaker(provider).call(lambda: _fetch_json(url, params, headers), before=acquire)
+
+    # Timed per caller, so a request that joined another's call still sees the wait
+    with metrics.span('upstream', provider=provider):
+        return flights.do(key, call)
+
+
+def _fetch_json(url, params, headers):
+    try:
+        response = get(url, params=params, headers=headers)
+    except requests.RequestException as e:
+        raise UpstreamUnavailable(str(e))
+    if response.status_code == 429 or response.status_code >= 500:
+        raise UpstreamUnavailable('{} answered {}'.format(url, response.status_code))
+    return response.json()
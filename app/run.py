@@ -1,64 +1,194 @@
+import time
+started = time.perf_counter()
+
+import logging
 import os
-import psycopg2
-from flask_swagger_ui import get_swaggerui_blueprint
-from flask import Flask
+import threading
+import click
+from flask import Flask, Response, request
 from flask_jwt_extended import JWTManager
 from flask_restful import Api
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
 
-app = Flask(__name__)
+# Must run before app.api modules read their environment configuration
+load_dotenv()
+
+from app.api import metrics
+
+logger = logging.getLogger(__name__)
+
+# Environment Configuration Variables
+warm_up_on_start = os.environ.get('WARM_UP', '1') == '1'
+# Connection pool per worker process; only applied to server databases, not SQLite
+db_pool_size = int(os.environ.get('DB_POOL_SIZE', 5))
+db_max_overflow = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+db_pool_timeout = float(os.environ.get('DB_POOL_TIMEOUT', 10))       # seconds to wait for a free connection
+db_pool_recycle = int(os.environ.get('DB_POOL_RECYCLE', 1800))       # reopen connections older than this
+db_pool_pre_ping = os.environ.get('DB_POOL_PRE_PING', '0') == '1'    # costs a round trip on every checkout
 
-### Initialize Swagger component ###
 SWAGGER_URL = ''
 API_URL = '/static/swagger.yml'
-SWAGGERUI_BLUEPRINT = get_swaggerui_blueprint(
-    SWAGGER_URL,
-    API_URL,
-    config={
-        'app_name': "trippyapi"
-    }
-)
-app.register_blueprint(SWAGGERUI_BLUEPRINT, url_prefix=SWAGGER_URL)
-
-api = Api(app)
-load_dotenv()
-
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'some-secret-string'
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
 
 db = SQLAlchemy()
-db.init_app(app)
-
-from app.api import models, resources
-
-@app.before_first_request
-def create_tables():
-    db.create_all()
-
-app.config['JWT_SECRET_KEY'] = 'jwt-secret-string'
-jwt = JWTManager(app)
-
-app.config['PROPAGATE_EXCEPTIONS'] = True
-app.config['JWT_BLACKLIST_ENABLED'] = True
-app.config['JWT_BLACKLIST_TOKEN_CHECKS'] = ['access', 'refresh']
-
-@jwt.token_in_blacklist_loader
-def check_if_token_in_blacklist(decrypted_token):
-    jti = decrypted_token['jti']
-    return models.RevokedTokenModel.is_jti_blacklisted(jti)
-
-
-api.add_resource(resources.UserRegistration, '/registration')
-api.add_resource(resources.UserLogin, '/login')
-api.add_resource(resources.UserLogoutAccess, '/logout/access')
-api.add_resource(resources.UserLogoutRefresh, '/logout/refresh')
-api.add_resource(resources.TokenRefresh, '/token/refresh')
-# api.add_resource(resources.AllUsers, '/users')
-api.add_resource(resources.WeatherResource, '/weather')
-api.add_resource(resources.WeatherFiveDayResource, '/fiveday')
-api.add_resource(resources.RestaurantResource, '/restaurants')
-api.add_resource(resources.EventResource, '/events')
-api.add_resource(resources.HotelResource, '/hotels')
-api.add_resource(resources.HotelInfoResource, '/hotel')
+jwt = JWTManager()
+
+_swagger_app = None
+_swagger_lock = threading.Lock()
+
+
+def create_app():
+    """
+    Builds the application without touching the database or any upstream, so it can
+    be imported once by `gunicorn --preload` and shared copy-on-write by every worker.
+    Tables are created by `flask init-db`, which the Procfile runs as the release phase.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = 'some-secret-string'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': db_pool_size,
+            'max_overflow': db_max_overflow,
+            'pool_timeout': db_pool_timeout,
+            'pool_recycle': db_pool_recycle,
+            'pool_pre_ping': db_pool_pre_ping
+        }
+    app.config['JWT_SECRET_KEY'] = 'jwt-secret-string'
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    app.config['JWT_BLACKLIST_ENABLED'] = True
+    app.config['JWT_BLACKLIST_TOKEN_CHECKS'] = ['access', 'refresh']
+
+    db.init_app(app)
+    jwt.init_app(app)
+
+    from app.api import conditional, encoding, models, prefetch, resources
+
+    metrics.init_app(app)
+    metrics.instrument_sqlalchemy()
+    conditional.init_app(app)
+
+    # Swagger UI is only built when the docs are first requested
+    app.add_url_rule(SWAGGER_URL + '/', 'swagger_ui', swagger_ui)
+    app.add_url_rule(SWAGGER_URL + '/<path:path>', 'swagger_ui', swagger_ui)
+
+    @app.before_first_request
+    def start_prefetcher():
+        if prefetch.prefetch_in_process:
+            prefetch.start_in_background()
+
+    @app.cli.command('init-db')
+    def init_db():
+        """Create missing tables and apply schema upgrades."""
+        db.create_all()
+        models.upgrade_schema()
+        click.echo('Database schema is up to date')
+
+    @app.cli.command('purge-revoked-tokens')
+    @click.option('--batch-size', default=1000, help='Rows deleted per transaction')
+    def purge_revoked_tokens(batch_size):
+        """Delete revoked tokens that have already expired."""
+        deleted = models.RevokedTokenModel.purge_expired(batch_size=batch_size)
+        click.echo('{} expired revoked token(s) deleted'.format(deleted))
+
+    @jwt.token_in_blacklist_loader
+    def check_if_token_in_blacklist(decrypted_token):
+        jti = decrypted_token['jti']
+        with metrics.span('jwt', step='blacklist'):
+            return models.RevokedTokenModel.is_jti_blacklisted(jti)
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        if metrics.metrics_token and request.headers.get('Authorization') != 'Bearer ' + metrics.metrics_token:
+            return Response(status=401)
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    api = Api(app)
+    api.representations['application/json'] = encoding.output_json
+    api.add_resource(resources.UserRegistration, '/registration')
+    api.add_resource(resources.UserLogin, '/login')
+    api.add_resource(resources.UserLogoutAccess, '/logout/access')
+    api.add_resource(resources.UserLogoutRefresh, '/logout/refresh')
+    api.add_resource(resources.TokenRefresh, '/token/refresh')
+    api.add_resource(resources.AllUsers, '/users')
+    api.add_resource(resources.WeatherResource, '/weather')
+    api.add_resource(resources.WeatherFiveDayResource, '/fiveday')
+    api.add_resource(resources.RestaurantResource, '/restaurants')
+    api.add_resource(resources.EventResource, '/events')
+    api.add_resource(resources.HotelResource, '/hotels')
+    api.add_resource(resources.HotelInfoResource, '/hotel')
+    api.add_resource(resources.TripResource, '/trip')
+    api.add_resource(resources.QuotaResource, '/quota')
+    return app
+
+
+def swagger_ui(path=None):
+    global _swagger_app
+    if _swagger_app is None:
+        with _swagger_lock:
+            if _swagger_app is None:
+                from flask_swagger_ui import get_swaggerui_blueprint
+                swagger_app = Flask(__name__)
+                swagger_app.register_blueprint(get_swaggerui_blueprint(
+                    SWAGGER_URL,
+                    API_URL,
+                    config={
+                        'app_name': "trippyapi"
+                    }
+                ), url_prefix=SWAGGER_URL)
+                _swagger_app = swagger_app
+    return Response.from_app(_swagger_app.wsgi_app, request.environ)
+
+
+def warm_up(app):
+    """
+    Loads what every worker would otherwise load on its first requests. Under
+    --preload this runs once in the master and the workers inherit the result.
+    """
+    from app.api import location, models
+    from app.api.gazetteer import gazetteer
+
+    began = time.perf_counter()
+    len(gazetteer)    # maps the zipcode file
+    for backend in getattr(location.backend, 'backends', [location.backend]):
+        if isinstance(backend, location.OfflineBackend):
+            backend._load()
+    with app.app_context():
+        try:
+            models.revocation_index.sync()
+        except Exception:
+            # The schema may not exist yet, e.g. while `flask init-db` itself is starting
+            logger.info('Revocation index not warmed', exc_info=True)
+        # Workers must open their own connections rather than share the master's sockets
+        db.session.remove()
+        db.engine.dispose()
+    metrics.record_startup('warm_up', time.perf_counter() - began)
+
+
+def warm_worker(app):
+    """
+    Opens the per-process pools a worker needs before it accepts traffic
+    """
+    from app.api import concurrency, upstream
+    from app.api.hashing import hashing_executor
+
+    began = time.perf_counter()
+    upstream.get_session()
+    concurrency.get_executor()
+    hashing_executor.warm_up()
+    with app.app_context():
+        try:
+            db.session.execute('SELECT 1')
+        finally:
+            db.session.remove()
+    metrics.record_startup('worker_warm_up', time.perf_counter() - began)
+
+
+app = create_app()
+if warm_up_on_start:
+    warm_up(app)
+
+startup_seconds = time.perf_counter() - started
+logger.info('Application ready in %.1fms', startup_seconds * 1000)
+metrics.record_startup('app', startup_seconds)
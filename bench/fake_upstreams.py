@@ -0,0 +1,263 @@
+"""
+Local stand-ins for OpenWeather, Zomato, Ticketmaster, OpenTripMap and ip-api.
+
+Each provider is served under its own path prefix with canned payloads shaped like
+the real responses, so the fetchers in app.api.providers parse them unchanged.
+Latency and error injection are configurable, and calls are counted per provider.
+
+    python -m bench.fake_upstreams --port 9000 --latency 50 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PROVIDERS = ('openweather', 'zomato', 'ticketmaster', 'opentripmap', 'ipapi')
+
+
+def env_for(base_url):
+    """
+    Environment variables that point the app at a fake upstream server
+    """
+    return {
+        'OPEN_WEATHER_URL': base_url + '/openweather',
+        'ZOMATO_URL': base_url + '/zomato',
+        'TICKETMASTER_URL': base_url + '/ticketmaster',
+        'OPENTRIP_URL': base_url + '/opentripmap',
+        'IP_API_URL': base_url + '/ipapi/json'
+    }
+
+
+def _city(zipcode):
+    # Stable per zipcode so cached and fresh answers agree
+    seed = int(zipcode) if str(zipcode).isdigit() else sum(map(ord, str(zipcode)))
+    return {
+        'name': 'City {}'.format(zipcode),
+        'lat': round(25 + seed % 2400 / 100.0, 4),
+        'lon': round(-120 + seed % 5000 / 100.0, 4)
+    }
+
+
+def weather(query):
+    city = _city(query.get('zip', '00000'))
+    return {
+        'dt': int(time.time()),
+        'name': city['name'],
+        'coord': {'lat': city['lat'], 'lon': city['lon']},
+        'main': {'temp': 71.3},
+        'weather': [{'description': 'clear sky'}]
+    }
+
+
+def forecast(query):
+    city = _city(query.get('zip', '00000'))
+    start = int(time.time()) // 10800 * 10800
+    return {
+        'city': {'name': city['name']},
+        'list': [
+            {'dt': start + i * 10800, 'main': {'temp': 60 + i % 8}, 'weather': [{'description': 'scattered clouds'}]}
+            for i in range(40)
+        ]
+    }
+
+
+def locations(query):
+    return {'location_suggestions': [{'entity_id': 292, 'entity_type': 'city'}]}
+
+
+def restaurants(query):
+    return {'restaurants': [
+        {'restaurant': {
+            'name': 'Restaurant {}'.format(i),
+            'location': {'address': '{} Main St'.format(100 + i)},
+            'phone_numbers': '(312) 555-01{:02d}'.format(i),
+            'cuisines': 'Pizza, Italian',
+            'price_range': 1 + i % 4,
+            'user_rating': {'aggregate_rating': '4.{}'.format(i % 10)}
+        }} for i in range(20)
+    ]}
+
+
+def events(query):
+    return {'_embedded': {'events': [
+        {
+            'name': 'Event {}'.format(i),
+            'dates': {'start': {'localDate': '2020-06-{:02d}'.format(1 + i % 28)}},
+            'classifications': [{
+                'segment': {'name': 'Music'},
+                'genre': {'name': 'Rock'},
+                'subGenre': {'name': 'Pop'}
+            }],
+            '_embedded': {'venues': [{'name': 'Venue {}'.format(i), 'address': {'line1': '{} Lake St'.format(i)}}]}
+        } for i in range(20)
+    ]}}
+
+
+def places(query):
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'name': 'Hotel {}'.format(i), 'rate': i % 4, 'xid': 'N{}'.format(1000 + i)}}
+        for i in range(50)
+    ]}
+
+
+def places_in_bbox(query):
+    # A fixed number of hotels spread over the box, stable per box so refetches agree
+    south, west = float(query.get('lat_min', 0)), float(query.get('lon_min', 0))
+    north, east = float(query.get('lat_max', 0)), float(query.get('lon_max', 0))
+    return {'type': 'FeatureCollection', 'features': [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [
+                round(west + (east - west) * (i % 5 + 0.5) / 5, 6), round(south + (north - south) * (i // 5 + 0.5) / 5, 6)
+            ]},
+            'properties': {'name': 'Hotel {:.2f},{:.2f} {}'.format(south, west, i), 'rate': i % 4,
+                           'xid': 'T{:.4f}_{:.4f}_{}'.format(south, west, i)}
+        }
+        for i in range(25)
+    ]}
+
+
+def place(query, xid):
+    return {'xid': xid, 'address': {'house_number': '1', 'road': 'Wacker Dr', 'city': 'City {}'.format(xid)}}
+
+
+def ip_location(query, ip):
+    return {'status': 'success', 'city': 'Chicago', 'country': 'United States', 'zip': '60604', 'query': ip}
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer only exists from Python 3.7
+    daemon_threads = True
+
+
+class FakeUpstreams(object):
+    """
+    Threaded HTTP server answering for every provider.
+
+    latency and jitter are in milliseconds; error_rate is the share of calls that
+    answer 503 instead.
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=50, jitter=10, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = dict((provider, 0) for provider in PROVIDERS)
+        self.errors = 0
+        self._lock = threading.Lock()
+        self.server = _Server((host, port), self._handler())
+        self.url = 'http://{}:{}'.format(host, self.server.server_port)
+
+    def _handler(self):
+        upstreams = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path == '/_stats':
+                    return self._send(200, upstreams.stats())
+                if parsed.path == '/_reset':
+                    upstreams.reset()
+                    return self._send(200, upstreams.stats())
+
+                route = upstreams.route(parsed.path)
+                if route is None:
+                    return self._send(404, {'message': 'not found'})
+                provider, answer = route
+                status, body = upstreams.answer(provider, answer, dict(
+                    (key, values[0]) for key, values in parse_qs(parsed.query).items()
+                ))
+                headers = {'X-Rl': '44', 'X-Ttl': '60'} if provider == 'ipapi' else {}
+                self._send(status, body, headers)
+
+            def _send(self, status, body, headers=None):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def route(self, path):
+        parts = path.strip('/').split('/')
+        provider, rest = parts[0], '/'.join(parts[1:])
+        if provider == 'openweather' and rest == 'weather':
+            return provider, weather
+        if provider == 'openweather' and rest == 'forecast':
+            return provider, forecast
+        if provider == 'zomato' and rest == 'locations':
+            return provider, locations
+        if provider == 'zomato' and rest == 'search':
+            return provider, restaurants
+        if provider == 'ticketmaster' and rest == 'events':
+            return provider, events
+        if provider == 'opentripmap' and rest == 'places/radius':
+            return provider, places
+        if provider == 'opentripmap' and rest == 'places/bbox':
+            return provider, places_in_bbox
+        if provider == 'opentripmap' and rest.startswith('places/xid/'):
+            return provider, lambda query: place(query, parts[-1])
+        if provider == 'ipapi' and len(parts) == 3 and parts[1] == 'json':
+            return provider, lambda query: ip_location(query, parts[-1])
+        return None
+
+    def answer(self, provider, answer, query):
+        with self._lock:
+            self.calls[provider] += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        if random.random() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            return 503, {'message': 'injected error'}
+        return 200, answer(query)
+
+    def stats(self):
+        with self._lock:
+            return {'calls': dict(self.calls), 'total': sum(self.calls.values()), 'errors': self.errors}
+
+    def reset(self):
+        with self._lock:
+            self.calls = dict((provider, 0) for provider in PROVIDERS)
+            self.errors = 0
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever, name='fake-upstreams', daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve fake upstream APIs for benchmarking')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--latency', type=float, default=50, help='milliseconds per upstream call')
+    parser.add_argument('--jitter', type=float, default=10, help='+/- milliseconds of random latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of calls answering 503')
+    args = parser.parse_args()
+
+    upstreams = FakeUpstreams(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    for name, value in sorted(env_for(upstreams.url).items()):
+        print('export {}={}'.format(name, value))
+    upstreams.server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
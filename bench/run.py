@@ -0,0 +1,292 @@
+"""
+Load driver for the API, run entirely offline against bench.fake_upstreams.
+
+Starts the fake upstreams, boots the app under gunicorn with a throwaway SQLite
+database (or --database-url), fires a fixed mix of requests at each endpoint and
+reports latency percentiles, throughput and upstream calls per request, plus how
+long the app took to start serving and to answer its first request.
+
+    python -m bench.run                      # compare against bench/baseline.json
+    python -m bench.run --save               # record a new baseline
+    python -m bench.run --scenarios weather login --requests 500 --concurrency 50
+"""
+import argparse
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.fake_upstreams import FakeUpstreams, env_for
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, 'bench', 'baseline.json')
+
+# Settings that must match for two runs to be comparable
+COMPARABLE_SETTINGS = ('scenarios', 'requests', 'concurrency', 'hashing_concurrency', 'latency', 'error_rate', 'zipcodes', 'workers', 'serve_mode')
+
+
+def zipcodes(count):
+    return ['{:05d}'.format(60601 + i) for i in range(count)]
+
+
+class Scenario(object):
+    """
+    One endpoint under load; request(i) returns (method, path, params, json body, headers)
+    """
+    def __init__(self, name, request, auth=True, hashing=False):
+        self.name = name
+        self.request = request
+        self.auth = auth
+        self.hashing = hashing
+
+
+def make_scenarios(zips, run_id):
+    def by_zip(path):
+        return lambda i: ('GET', path, {'zipcode': zips[i % len(zips)]}, None, {})
+
+    return [
+        Scenario('registration', lambda i: (
+            'POST', '/registration', None, {'username': 'bench-{}-{}'.format(run_id, i), 'password': 'bench-password'}, {}
+        ), auth=False, hashing=True),
+        Scenario('login', lambda i: (
+            'POST', '/login', None, {'username': 'bench-{}'.format(run_id), 'password': 'bench-password'}, {}
+        ), auth=False, hashing=True),
+        Scenario('weather', by_zip('/weather')),
+        Scenario('weather-ip', lambda i: (
+            'GET', '/weather', None, None, {'X-Forwarded-For': '198.51.{}.{}'.format(i % 200, i % 250 + 1)}
+        )),
+        Scenario('weather-batch', lambda i: (
+            'GET', '/weather', {'zipcode': ','.join(zips[(i + j) % len(zips)] for j in range(10))}, None, {}
+        )),
+        Scenario('fiveday', by_zip('/fiveday')),
+        Scenario('restaurants', by_zip('/restaurants')),
+        Scenario('events', by_zip('/events')),
+        Scenario('hotels', by_zip('/hotels')),
+        Scenario('hotel', lambda i: ('GET', '/hotel', {'xid': 'N{}'.format(1000 + i % 50)}, None, {})),
+        Scenario('trip', by_zip('/trip'))
+    ]
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of values, which must already be sorted
+    """
+    if not values:
+        return 0.0
+    rank = max(1, int(math.ceil(pct / 100.0 * len(values))))
+    return values[min(rank, len(values)) - 1]
+
+
+def run_scenario(base_url, scenario, count, concurrency, token, upstreams):
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+
+    def one(i):
+        method, path, params, body, headers = scenario.request(i)
+        if scenario.auth:
+            headers = dict(headers, Authorization='Bearer {}'.format(token))
+        started = time.perf_counter()
+        try:
+            response = session().request(method, base_url + path, params=params, json=body, headers=headers, timeout=60)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return (time.perf_counter() - started) * 1000, ok
+
+    upstreams.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(count)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in outcomes)
+    return {
+        'requests': count,
+        'errors': sum(1 for _, ok in outcomes if not ok),
+        'rps': round(count / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'upstream_per_request': round(upstreams.stats()['total'] / float(count), 3)
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a description of every metric that regressed by more than tolerance
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None:
+            continue
+        # p99 over a few hundred requests is too noisy to gate on; it is reported only
+        for metric in ('p50_ms', 'p95_ms'):
+            # A few milliseconds either way is scheduler noise, not a regression
+            if result[metric] > before[metric] * (1 + tolerance) + 5:
+                regressions.append('{} {} {} -> {}'.format(name, metric, before[metric], result[metric]))
+        if result['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append('{} rps {} -> {}'.format(name, before['rps'], result['rps']))
+        if result['upstream_per_request'] > before['upstream_per_request'] * (1 + tolerance) + 0.05:
+            regressions.append('{} upstream_per_request {} -> {}'.format(
+                name, before['upstream_per_request'], result['upstream_per_request']))
+        if result['errors'] > before['errors']:
+            regressions.append('{} errors {} -> {}'.format(name, before['errors'], result['errors']))
+    return regressions
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def app_environment(args, upstreams, workdir, port):
+    env = dict(os.environ)
+    env.update(env_for(upstreams.url))
+    env.update({
+        'DATABASE_URL': args.database_url or 'sqlite:///' + os.path.join(workdir, 'bench.sqlite3'),
+        'SHARED_STORE_PATH': os.path.join(workdir, 'shared.sqlite3'),
+        'GAZETTEER_PATH': os.path.join(workdir, 'no-gazetteer.bin'),
+        'IP_GEO_BACKEND': 'remote',
+        'TRUSTED_PROXY_COUNT': '1',
+        'OPEN_WEATHER_KEY': 'bench', 'ZOMATO_KEY': 'bench', 'TICKETMASTER_KEY': 'bench', 'OPENTRIP_KEY': 'bench',
+        'PORT': str(port),
+        'WEB_CONCURRENCY': str(args.workers),
+        'SERVE_MODE': args.serve_mode,
+        'PYTHONPATH': ROOT
+    })
+    if not args.real_quotas:
+        # The stand-ins have no rate limits; measure the app rather than the free tiers
+        for provider in ('OPENWEATHER', 'ZOMATO', 'TICKETMASTER', 'OPENTRIPMAP', 'IPAPI'):
+            env['QUOTA_{}'.format(provider)] = '100000/1'
+        env['QUOTA_MAX_BURST'] = '100000'
+    return env
+
+
+def init_db(env):
+    subprocess.run([sys.executable, '-m', 'flask', 'init-db'], cwd=ROOT, env=dict(env, FLASK_APP='app.run'),
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def start_app(env, base_url, log_path):
+    """
+    Starts gunicorn and returns (process, seconds until it answered)
+    """
+    started = time.perf_counter()
+    with open(log_path, 'wb') as log:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'app.run:app'],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            with open(log_path) as log:
+                raise SystemExit('app exited on startup:\n' + log.read())
+        try:
+            requests.get(base_url + '/quota', timeout=1)
+            return process, time.perf_counter() - started
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('app did not start within 30s')
+
+
+def print_table(results):
+    columns = ('requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'upstream_per_request')
+    print('{:<14}'.format('scenario') + ''.join('{:>22}'.format(column) for column in columns))
+    for name, result in results.items():
+        print('{:<14}'.format(name) + ''.join('{:>22}'.format(result[column]) for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the API against local fake upstreams')
+    parser.add_argument('--scenarios', nargs='*', help='scenario names to run (default: all)')
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--hashing-concurrency', type=int, default=4,
+                        help='concurrency for registration and login, which past HASH_QUEUE_SIZE answer 503 by design')
+    parser.add_argument('--latency', type=float, default=50, help='fake upstream latency in milliseconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of upstream calls answering 503')
+    parser.add_argument('--zipcodes', type=int, default=25, help='distinct zipcodes requested')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--serve-mode', default='async', choices=('async', 'sync'))
+    parser.add_argument('--database-url', help='defaults to a throwaway SQLite file')
+    parser.add_argument('--real-quotas', action='store_true', help='keep the free-tier provider quotas')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='allowed relative regression')
+    args = parser.parse_args()
+
+    settings = dict((name, getattr(args, name)) for name in COMPARABLE_SETTINGS)
+    upstreams = FakeUpstreams(latency=args.latency, error_rate=args.error_rate).start()
+    workdir = tempfile.mkdtemp(prefix='trippy-bench-')
+    port = free_port()
+    base_url = 'http://127.0.0.1:{}'.format(port)
+    env = app_environment(args, upstreams, workdir, port)
+    init_db(env)
+    process, boot_seconds = start_app(env, base_url, os.path.join(workdir, 'app.log'))
+
+    try:
+        run_id = '{:x}'.format(int(time.time() * 1000))
+        # The first request that reaches the database and the hashing pool
+        began = time.perf_counter()
+        response = requests.post(base_url + '/registration', json={
+            'username': 'bench-{}'.format(run_id), 'password': 'bench-password'
+        })
+        startup = {
+            'boot_seconds': round(boot_seconds, 3),
+            'first_request_ms': round((time.perf_counter() - began) * 1000, 1)
+        }
+        token = response.json()['access_token']
+
+        results = {}
+        for scenario in make_scenarios(zipcodes(args.zipcodes), run_id):
+            if args.scenarios and scenario.name not in args.scenarios:
+                continue
+            concurrency = args.hashing_concurrency if scenario.hashing else args.concurrency
+            results[scenario.name] = run_scenario(base_url, scenario, args.requests, concurrency, token, upstreams)
+    finally:
+        process.terminate()
+        process.wait()
+        upstreams.stop()
+
+    print('startup: {boot_seconds}s until serving, first request {first_request_ms}ms'.format(**startup))
+    print_table(results)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({'settings': settings, 'startup': startup, 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('baseline written to {}'.format(args.baseline))
+        return
+
+    if not os.path.exists(args.baseline):
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['settings'] != settings:
+        print('baseline was recorded with different settings; not comparing: {}'.format(baseline['settings']))
+        return
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
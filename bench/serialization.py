@@ -0,0 +1,88 @@
+"""
+CPU and memory of turning provider payloads into responses, per request.
+
+Times the single-pass extractors in app.api.records and the two encode paths a
+request takes: a cache miss encodes freshly extracted records, a cache hit decodes
+the cached JSON and encodes it again. Each is run with the stdlib json backend and,
+when installed, orjson. Memory compares the records with the dicts they replace.
+
+    python -m bench.serialization --items 200
+"""
+import argparse
+import json
+import timeit
+import tracemalloc
+
+from app.api import records
+from app.api.encoding import default
+from bench import fake_upstreams
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def stdlib_dumps(value):
+    return json.dumps(value, separators=(',', ':'), default=default)
+
+
+def orjson_dumps(value):
+    return orjson.dumps(value, default=default).decode('utf-8')
+
+
+def payloads(items):
+    restaurants = fake_upstreams.restaurants({})
+    restaurants['restaurants'] = (restaurants['restaurants'] * (items // 20 + 1))[:items]
+    events = fake_upstreams.events({})
+    events['_embedded']['events'] = (events['_embedded']['events'] * (items // 20 + 1))[:items]
+    return {'restaurants': (restaurants, records.restaurants), 'events': (events, records.events)}
+
+
+def per_call_us(func, number):
+    return round(min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6, 1)
+
+
+def allocated_bytes(build):
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del value
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure payload extraction and JSON encoding')
+    parser.add_argument('--items', type=int, default=200, help='restaurants or events per payload')
+    parser.add_argument('--number', type=int, default=200, help='calls per timing')
+    args = parser.parse_args()
+
+    backends = [('json', stdlib_dumps, json.loads)]
+    if orjson is not None:
+        backends.append(('orjson', orjson_dumps, orjson.loads))
+
+    print('{:<12}{:<10}{:>14}{:>14}{:>14}'.format('payload', 'backend', 'extract_us', 'miss_us', 'hit_us'))
+    for name, (payload, extract) in payloads(args.items).items():
+        extracted = extract(payload)
+        extract_us = per_call_us(lambda: extract(payload), args.number)
+        for backend, dumps, loads in backends:
+            cached = dumps(extracted)
+            print('{:<12}{:<10}{:>14}{:>14}{:>14}'.format(
+                name, backend, extract_us,
+                per_call_us(lambda: dumps(extract(payload)), args.number),
+                per_call_us(lambda: dumps(loads(cached)), args.number)
+            ))
+
+    print()
+    print('{:<12}{:>18}{:>18}'.format('payload', 'dict_bytes', 'record_bytes'))
+    for name, (payload, extract) in payloads(args.items).items():
+        print('{:<12}{:>18}{:>18}'.format(
+            name,
+            allocated_bytes(lambda: [record.as_dict() for record in extract(payload)]),
+            allocated_bytes(lambda: extract(payload))
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import multiprocessing
+import sys
+from os import environ
+
+# Environment Configuration Variables
+serve_mode = environ.get('SERVE_MODE', 'async')      # async (gevent) or sync
+bind = '0.0.0.0:{}'.format(environ.get('PORT', 8000))
+workers = int(environ.get('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count() * 2 + 1)))
+worker_connections = int(environ.get('WORKER_CONNECTIONS', 1000))  # in-flight requests per async worker
+timeout = int(environ.get('WORKER_TIMEOUT', 30))
+# Import the app once in the master so workers fork from it copy-on-write and start serving at once
+preload_app = environ.get('PRELOAD_APP', '1') == '1'
+
+if serve_mode == 'async':
+    # Every resource spends its time waiting on upstream HTTP, so each worker runs
+    # requests as greenlets: requests, sockets, time.sleep and threading are patched
+    # to yield while they wait instead of holding the worker.
+    worker_class = 'gevent'
+    # Thread pools become greenlet pools, so size them for the in-flight requests
+    # rather than for the CPU; explicit settings still win.
+    environ.setdefault('UPSTREAM_POOL_MAXSIZE', str(worker_connections))
+    environ.setdefault('FANOUT_WORKERS', str(worker_connections))
+    if preload_app:
+        # The app is imported in the master, so patch before it imports ssl and threading
+        from gevent import monkey
+        monkey.patch_all()
+else:
+    worker_class = 'sync'
+
+
+def post_fork(server, worker):
+    if worker_class != 'gevent':
+        return
+    # psycopg2 is a C extension gevent cannot patch; route its waits through the hub
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        server.log.warning('psycogreen is not installed; Postgres queries will block the worker')
+        return
+    patch_psycopg()
+
+
+def post_worker_init(worker):
+    # Open this worker's own connection pools before it accepts traffic
+    run = sys.modules.get('app.run')
+    if run is not None and run.warm_up_on_start:
+        run.warm_worker(run.app)
@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+# app.run builds the application on import, so its environment must be in place first
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('WARM_UP', '0')
+
+
+@pytest.fixture
+def app():
+    """
+    The application on an in-memory SQLite database, with fresh tables for each test
+    """
+    from app import run
+
+    with run.app.app_context():
+        run.db.create_all()
+        try:
+            yield run.app
+        finally:
+            run.db.session.remove()
+            run.db.drop_all()
@@ -0,0 +1,47 @@
+import time
+
+from app.api import concurrency
+
+
+def test_gather_runs_tasks_in_parallel():
+    started = time.time()
+    results, errors = concurrency.gather({
+        'weather': lambda: time.sleep(0.1) or 'sunny',
+        'events': lambda: time.sleep(0.1) or ['fair']
+    })
+    assert results == {'weather': 'sunny', 'events': ['fair']}
+    assert errors == {}
+    assert time.time() - started < 0.19
+
+
+def test_gather_returns_partial_results():
+    def fail():
+        raise KeyError('_embedded')
+
+    results, errors = concurrency.gather({
+        'weather': lambda: 'sunny',
+        'events': fail,
+        'hotels': lambda: time.sleep(0.5)
+    }, timeouts={'hotels': 0.05})
+    assert results == {'weather': 'sunny'}
+    assert isinstance(errors['events'], KeyError)
+    assert isinstance(errors['hotels'], TimeoutError)
+
+
+def test_map_bounded_deduplicates_and_limits_concurrency():
+    running = []
+    peak = []
+
+    def fetch(xid):
+        running.append(xid)
+        peak.append(len(running))
+        time.sleep(0.02)
+        running.remove(xid)
+        if xid == 'bad':
+            raise KeyError('address')
+        return xid.upper()
+
+    results, errors = concurrency.map_bounded(fetch, ['b', 'a', 'b', 'bad', 'c', 'a'], limit=2)
+    assert list(results) == ['b', 'a', 'c']
+    assert list(errors) == ['bad']
+    assert max(peak) <= 2
@@ -0,0 +1,79 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask, jsonify
+
+from app.api import conditional
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(conditional, 'compress_min_bytes', 100)
+    conditional.compressed_bodies.clear()
+    app = Flask(__name__)
+    conditional.init_app(app)
+    state = {'temperature': 70}
+
+    @app.route('/weather')
+    def weather():
+        return jsonify([dict(state, hour=hour) for hour in range(20)])
+
+    @app.route('/quota')
+    def quota():
+        return jsonify([dict(state, hour=hour) for hour in range(20)])
+
+    client = app.test_client()
+    client.state = state
+    return client
+
+
+def test_unchanged_body_answers_304(client):
+    first = client.get('/weather')
+    etag = first.headers['ETag']
+    assert etag.startswith('W/"')
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    again = client.get('/weather', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+
+    client.state['temperature'] = 71
+    changed = client.get('/weather', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_large_bodies_are_gzipped_once(client):
+    plain = client.get('/weather')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    for _ in range(2):
+        response = client.get('/weather', headers={'Accept-Encoding': 'gzip, deflate'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert json.loads(gzip.decompress(response.get_data())) == plain.get_json()
+        assert response.headers['ETag'] == plain.headers['ETag']
+    assert conditional.compressed_bodies.stats()['hits'] == 1
+
+    refused = client.get('/weather', headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'Content-Encoding' not in refused.headers
+
+
+def test_compressed_output_is_stable():
+    body = b'{"temperature": 70}' * 100
+    assert conditional.compress(body, 'gzip') == conditional.compress(body, 'gzip')
+    assert gzip.decompress(conditional.compress(body, 'gzip')) == body
+
+
+@pytest.mark.skipif(conditional.brotli is None, reason='brotli is not installed')
+def test_brotli_is_preferred_when_accepted(client):
+    response = client.get('/weather', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert json.loads(conditional.brotli.decompress(response.get_data()))[0]['hour'] == 0
+
+
+def test_other_endpoints_are_left_alone(client):
+    response = client.get('/quota', headers={'Accept-Encoding': 'gzip'})
+    assert 'ETag' not in response.headers
+    assert 'Content-Encoding' not in response.headers
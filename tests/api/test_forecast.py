@@ -0,0 +1,53 @@
+import pytest
+
+from app.api.forecast import InvalidFields, daily, parse_fields, shape
+
+
+def point(time, temperature, description='clear sky'):
+    return {'city': 'Chicago', 'time': time, 'temperature': temperature, 'description': description}
+
+
+FIVE_DAY = [
+    point('2020-06-01 18:00:00', 70),
+    point('2020-06-01 21:00:00', 64, 'rain'),
+    point('2020-06-02 00:00:00', 58, 'rain'),
+    point('2020-06-02 03:00:00', 55),
+    point('2020-06-02 06:00:00', 61, 'rain'),
+]
+
+
+def test_raw_is_unchanged_by_default():
+    assert shape(FIVE_DAY) is FIVE_DAY
+
+
+def test_3h_names_the_city_once():
+    result = shape(FIVE_DAY, '3h')
+    assert result['city'] == 'Chicago'
+    assert result['granularity'] == '3h'
+    assert result['forecast'][0] == {'time': '2020-06-01 18:00:00', 'temperature': 70, 'description': 'clear sky'}
+    assert len(result['forecast']) == len(FIVE_DAY)
+
+
+def test_daily_summarises_each_day():
+    assert daily(FIVE_DAY) == [
+        {'date': '2020-06-01', 'min': 64, 'max': 70, 'mean': 67.0, 'description': 'clear sky'},
+        {'date': '2020-06-02', 'min': 55, 'max': 61, 'mean': 58.0, 'description': 'rain'},
+    ]
+
+
+def test_fields_project_in_schema_order():
+    fields = parse_fields('max, date', 'daily')
+    assert fields == ('date', 'max')
+    assert shape(FIVE_DAY, 'daily', fields)['forecast'] == [
+        {'date': '2020-06-01', 'max': 70}, {'date': '2020-06-02', 'max': 61}
+    ]
+
+
+def test_unknown_fields_are_rejected():
+    assert parse_fields('', 'raw') is None
+    with pytest.raises(InvalidFields):
+        parse_fields('city', 'daily')
+
+
+def test_empty_forecast():
+    assert shape([], 'daily') == {'city': None, 'granularity': 'daily', 'forecast': []}
@@ -0,0 +1,51 @@
+import io
+import zipfile
+
+from app.api import gazetteer
+from app.api.gazetteer import Gazetteer
+
+
+def build(tmp_path, rows):
+    path = str(tmp_path / 'zipcodes.bin')
+    gazetteer.write(rows, path)
+    return Gazetteer(path)
+
+
+def test_lookup_finds_zipcodes_with_leading_zeros(tmp_path):
+    index = build(tmp_path, [
+        ('60601', 'Chicago', 41.8858, -87.6181),
+        ('02134', 'Allston', 42.3539, -71.1337),
+        ('94103', 'San Francisco', 37.7725, -122.4147)
+    ])
+    assert len(index) == 3
+    assert index.lookup('02134') == {'city': 'Allston', 'lat': 42.3539, 'lon': -71.1337}
+    assert index.lookup('60601-1234')['city'] == 'Chicago'
+    assert index.lookup('60602') is None
+    assert index.lookup('abcde') is None
+
+
+def test_missing_file_misses_every_lookup(tmp_path):
+    assert Gazetteer(str(tmp_path / 'missing.bin')).lookup('60601') is None
+
+
+def test_read_geonames_and_csv():
+    geonames = 'US\t60601\tChicago\tIllinois\tIL\tCook\t031\t\t\t41.8858\t-87.6181\t4\n'
+    assert list(gazetteer.read_geonames(io.StringIO(geonames))) == [('60601', 'Chicago', '41.8858', '-87.6181')]
+    csv_rows = 'Zipcode,City,Latitude,Longitude\n60601,Chicago,41.8858,-87.6181\n'
+    assert list(gazetteer.read_csv(io.StringIO(csv_rows))) == [('60601', 'Chicago', '41.8858', '-87.6181')]
+
+
+def test_download_converts_the_geonames_archive(tmp_path):
+    archive = tmp_path / 'US.zip'
+    with zipfile.ZipFile(str(archive), 'w') as f:
+        f.writestr('readme.txt', 'GeoNames postal codes, CC BY 4.0')
+        f.writestr('US.txt', 'US\t60601\tChicago\tIllinois\tIL\tCook\t031\t\t\t41.8858\t-87.6181\t4\n')
+    output = str(tmp_path / 'zipcodes.bin')
+
+    assert gazetteer.main(['download', output, '--url', archive.as_uri()]) == 0
+    assert Gazetteer(output).lookup('60601')['city'] == 'Chicago'
+
+
+def test_missing_file_is_logged(tmp_path, caplog):
+    assert len(Gazetteer(str(tmp_path / 'missing.bin'))) == 0
+    assert 'No gazetteer at' in caplog.text
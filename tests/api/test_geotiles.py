@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from app.api.geotiles import SCHEMA, InvalidArea, TileIndex, distance, order
+from app.api.resilience import UpstreamUnavailable
+from app.api.shared_store import SharedStore
+
+
+class FakeProvider(object):
+    """
+    Four hotels per tile, one near each corner
+    """
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    def __call__(self, south, west, north, east):
+        self.calls.append((south, west))
+        if self.fail:
+            raise UpstreamUnavailable('down')
+        step = (north - south) / 4.0
+        return [
+            {'xid': '{:.2f},{:.2f}:{}'.format(south, west, i), 'name': 'Hotel {}'.format(i), 'rating': i,
+             'lat': south + step * (1 + 2 * (i // 2)), 'lon': west + step * (1 + 2 * (i % 2))}
+            for i in range(4)
+        ]
+
+
+@pytest.fixture
+def provider():
+    return FakeProvider()
+
+
+@pytest.fixture
+def index(tmp_path, provider):
+    return TileIndex('accomodations', provider, SharedStore(str(tmp_path / 'tiles.sqlite3'), SCHEMA), degrees=1)
+
+
+def test_neighbouring_queries_share_tiles(index, provider):
+    first = index.radius(41.5, -87.5, 40000)
+    assert len(provider.calls) == 1
+    assert len(first) == 4
+    assert [hotel['distance'] for hotel in first] == sorted(hotel['distance'] for hotel in first)
+
+    assert len(index.radius(41.55, -87.45, 30000)) == 1
+    assert len(provider.calls) == 1
+    assert index.stats()['hits'] == 1
+
+
+def test_radius_spanning_tiles_fetches_each_once(index, provider):
+    hotels = index.radius(42.0, -88.0, 50000)
+    assert sorted(provider.calls) == [(41, -89), (41, -88), (42, -89), (42, -88)]
+    assert len(hotels) == 4
+
+
+def test_bbox_and_sort_by_rating(index):
+    hotels = index.bbox(41.0, -88.0, 42.0, -87.0, sort='rating', limit=2)
+    assert [hotel['rating'] for hotel in hotels] == [3, 2]
+    with pytest.raises(InvalidArea):
+        index.bbox(42.0, -88.0, 41.0, -87.0)
+    with pytest.raises(InvalidArea):
+        index.bbox(0, 0, 20, 20)
+
+
+def test_expired_tiles_are_refetched_or_served_while_down(index, provider):
+    index.ttl = 0
+    index.radius(41.5, -87.5, 1000)
+    time.sleep(0.01)
+    provider.fail = True
+    index.radius(41.5, -87.5, 1000)
+    assert index.stats()['fallback_hits'] == 1
+
+    with pytest.raises(UpstreamUnavailable):
+        index.radius(10.5, 10.5, 1000)
+
+
+def test_distance_and_rating_order():
+    assert round(distance(41.8781, -87.6298, 40.7128, -74.0060) / 1000) == 1144
+    places = [{'rating': '3h', 'distance': 5}, {'rating': 1, 'distance': 1}, {'rating': 3, 'distance': 2}]
+    assert order(places, 'rating') == [places[2], places[0], places[1]]
+    assert order(places, limit=1) == [places[1]]
@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from app.api import hashing
+from app.api.hashing import HashingBusy, HashingExecutor
+
+
+def test_verify_flags_hashes_with_old_rounds_for_rehash():
+    old = HashingExecutor(workers=0, rounds=1000)
+    new = HashingExecutor(workers=0, rounds=1200)
+    stored = old.hash_password('hunter2')
+
+    assert old.verify_and_update('hunter2', stored) == (True, None)
+    valid, rehashed = new.verify_and_update('hunter2', stored)
+    assert valid
+    assert '$1200$' in rehashed
+    assert new.verify_and_update('wrong', stored) == (False, None)
+
+
+def test_full_queue_rejects_instead_of_waiting():
+    executor = HashingExecutor(workers=1, queue_size=0, rounds=1000)
+    executor._slots.acquire()
+    with pytest.raises(HashingBusy):
+        executor.hash_password('hunter2')
+    assert executor.stats()['rejected'] == 1
+
+
+def test_process_pool_hashes():
+    executor = HashingExecutor(workers=1, queue_size=1, rounds=1000)
+    stored = executor.hash_password('hunter2')
+    assert executor.verify_and_update('hunter2', stored) == (True, None)
+    assert executor.stats()['completed'] == 2
+
+
+def test_warm_up_starts_the_pool_without_counting_work():
+    executor = HashingExecutor(workers=1, queue_size=1, rounds=1000)
+    executor.warm_up()
+    assert executor._pool is not None
+    assert executor.stats()['completed'] == 0
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def test_timed_out_hash_keeps_its_slot_until_it_finishes():
+    executor = HashingExecutor(workers=1, queue_size=0, rounds=1000)
+    executor.warm_up()
+    executor.timeout = 0.05
+    with pytest.raises(HashingBusy):
+        executor._run(_sleep, 0.5)
+    assert executor.stats()['timed_out'] == 1
+
+    # The abandoned hash still holds the only slot, so the next caller is turned away
+    with pytest.raises(HashingBusy):
+        executor._run(_sleep, 0)
+    assert executor.stats()['rejected'] == 1
+
+    deadline = time.time() + 5
+    while executor.stats()['in_flight'] and time.time() < deadline:
+        time.sleep(0.01)
+    assert executor._run(_sleep, 0) == 0
+
+
+def test_pool_state_is_exported_to_metrics():
+    executor = HashingExecutor(workers=2, queue_size=2, rounds=1000)
+    executor.in_flight, executor.rejected = 3, 4
+    assert hashing.queue_collector(executor)() == {
+        ('trippy_hashing_in_flight', ()): 3,
+        ('trippy_hashing_queued', ()): 1
+    }
+    assert hashing.rejection_collector(executor)()[('trippy_hashing_rejected_total', (('reason', 'full'),))] == 4
@@ -3,3 +3,49 @@ from app.api import location
 
 def test_location_returns_hardcoded_value():
     pass
+
+
+def test_client_ip_trusts_only_the_proxy_appended_entries():
+    assert location.client_ip('6.6.6.6, 203.0.113.7', '10.0.0.1', trusted_proxies=1) == '203.0.113.7'
+    assert location.client_ip('203.0.113.7, 10.1.1.1', '10.0.0.1', trusted_proxies=2) == '203.0.113.7'
+    assert location.client_ip('203.0.113.7', '10.0.0.1', trusted_proxies=3) == '203.0.113.7'
+    assert location.client_ip('not-an-ip', '10.0.0.1', trusted_proxies=1) == '10.0.0.1'
+    assert location.client_ip(None, '10.0.0.1') == '10.0.0.1'
+
+
+def test_prefix_key_groups_nearby_addresses():
+    assert location.prefix_key('203.0.113.7') == location.prefix_key('203.0.113.200') == '203.0.113.0/24'
+    assert location.prefix_key('2001:db8:1:2::1') == '2001:db8:1::/48'
+
+
+def test_offline_backend_finds_enclosing_range(tmp_path):
+    path = tmp_path / 'ranges.csv'
+    path.write_text(
+        'start,end,zipcode,city,country\n'
+        '203.0.113.0,203.0.113.255,60601,Chicago,United States\n'
+        '198.51.100.0,198.51.100.127,94103,San Francisco,United States\n'
+        '2001:db8::,2001:db8:ffff:ffff:ffff:ffff:ffff:ffff,02134,Allston,United States\n'
+    )
+    backend = location.OfflineBackend(str(path))
+    assert backend.lookup('203.0.113.7')['zipcode'] == '60601'
+    assert backend.lookup('::ffff:198.51.100.5')['city'] == 'San Francisco'
+    assert backend.lookup('198.51.100.200') is None
+    assert backend.lookup('2001:db8::42')['zipcode'] == '02134'
+
+
+def test_remote_backend_caches_by_prefix_and_respects_rate_limit(monkeypatch):
+    calls = []
+
+    class Response(object):
+        status_code = 200
+        headers = {'X-Rl': '0', 'X-Ttl': '30'}
+
+        def json(self):
+            return {'query': '203.0.113.7', 'city': 'Chicago', 'country': 'United States', 'zip': '60601'}
+
+    monkeypatch.setattr(location.upstream, 'get', lambda url, **kwargs: calls.append(url) or Response())
+    backend = location.RemoteBackend()
+    assert backend.lookup('203.0.113.7')['zipcode'] == '60601'
+    assert backend.lookup('203.0.113.99')['zipcode'] == '60601'
+    assert backend.lookup('198.51.100.1') is None
+    assert len(calls) == 1
@@ -0,0 +1,111 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from app.api import metrics
+from app.api.metrics import SCHEMA, Registry
+from app.api.shared_store import SharedStore
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = Registry(SharedStore(str(tmp_path / 'metrics.sqlite3'), SCHEMA))
+    monkeypatch.setattr(metrics, 'registry', registry)
+    return registry
+
+
+def insert(registry, pid, name, labels, kind, value, flushed_at=None):
+    registry.store.execute(
+        'INSERT INTO metric_series (pid, name, labels, kind, value, flushed_at) VALUES (?, ?, ?, ?, ?, ?)',
+        (pid, name, json.dumps(labels), kind, json.dumps(value), time.time() if flushed_at is None else flushed_at)
+    )
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_histograms_add_up_across_workers(registry, monkeypatch):
+    monkeypatch.setattr(metrics, '_alive', lambda pid: True)
+    registry.observe('trippy_request_seconds', {'endpoint': '/weather'}, 0.03)
+    registry.flush()
+    # Another worker's latest flush
+    counts = [0] * (len(metrics.BUCKETS) + 1)
+    counts[-1] = 1
+    insert(registry, os.getpid() + 1, 'trippy_request_seconds', [['endpoint', '/weather']], 'histogram', [counts, 12.0])
+
+    text = metrics.render()
+    assert 'trippy_request_seconds_bucket{endpoint="/weather",le="0.05"} 1' in text
+    assert 'trippy_request_seconds_bucket{endpoint="/weather",le="+Inf"} 2' in text
+    assert 'trippy_request_seconds_count{endpoint="/weather"} 2' in text
+
+
+def test_cache_hit_ratio_counts_stale_hits(registry):
+    class Cache(object):
+        def stats(self):
+            return {'hits': 6, 'stale_hits': 2, 'fallback_hits': 1, 'misses': 2}
+
+    registry.register(metrics.cache_collector('response', Cache()))
+    assert 'trippy_cache_hit_ratio{cache="response"} 0.8' in metrics.render()
+
+
+def test_spans_on_pool_threads_join_the_request_trace(registry):
+    metrics._local.trace = trace = metrics.Trace()
+    try:
+        with metrics.span('geocode', step='city_details'):
+            pass
+        thread = threading.Thread(target=metrics.bind(lambda: metrics.record('upstream', 0.2, provider='zomato')))
+        thread.start()
+        thread.join()
+    finally:
+        metrics._local.trace = None
+
+    assert [name for name, _, _ in trace.spans] == ['geocode', 'upstream']
+    assert 'upstream[zomato] 200.0ms' in metrics.format_spans(trace.spans)
+
+
+def test_a_locked_store_does_not_fail_the_request(registry, monkeypatch):
+    def locked():
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(registry.store, 'transaction', locked)
+    monkeypatch.setattr(metrics, 'metrics_flush_interval', 0)
+    app = Flask(__name__)
+    metrics.init_app(app)
+    app.add_url_rule('/weather', 'weather', lambda: 'sunny')
+
+    assert app.test_client().get('/weather').status_code == 200
+    metrics.record_startup('app', 0.1)
+    # Nothing is lost; the histograms are written by the next flush that succeeds
+    del registry.store.transaction
+    registry.flush()
+    assert 'trippy_request_seconds_count{endpoint="/weather",method="GET",status="200"} 1' in metrics.render()
+
+
+def test_exited_workers_keep_their_totals_but_not_their_gauges(registry):
+    pid = exited_pid()
+    insert(registry, pid, 'trippy_hashing_in_flight', [], 'gauge', 3)
+    insert(registry, pid, 'trippy_hashing_rejected_total', [['reason', 'full']], 'counter', 2)
+    insert(registry, metrics.RETIRED_PID, 'trippy_hashing_rejected_total', [['reason', 'full']], 'counter', 5)
+    registry.register(lambda: {('trippy_hashing_in_flight', ()): 1}, kind='gauge')
+
+    text = metrics.render()
+    assert 'trippy_hashing_in_flight 1' in text
+    assert 'trippy_hashing_rejected_total{reason="full"} 7' in text
+    assert registry.store.execute('SELECT COUNT(*) FROM metric_series WHERE pid = ?', (pid,)).fetchone() == (0,)
+
+
+def test_gauges_stop_counting_once_their_worker_stops_flushing(registry, monkeypatch):
+    monkeypatch.setattr(metrics, '_alive', lambda pid: True)
+    insert(registry, os.getpid() + 1, 'trippy_hashing_queued', [], 'gauge', 4, flushed_at=time.time() - 3600)
+    insert(registry, os.getpid() + 2, 'trippy_hashing_queued', [], 'gauge', 2)
+    assert 'trippy_hashing_queued 2' in metrics.render()
@@ -0,0 +1,28 @@
+from app.run import db
+from app.api.models import UserModel
+
+
+def add_users(count):
+    db.session.add_all([UserModel(username='user{}'.format(i), password='$pbkdf2-sha256$secret') for i in range(count)])
+    db.session.commit()
+
+
+def test_user_listing_never_includes_passwords(app):
+    add_users(3)
+    users = list(UserModel.iter_public())
+    assert users == [{'id': 1, 'username': 'user0'}, {'id': 2, 'username': 'user1'}, {'id': 3, 'username': 'user2'}]
+    assert all(set(user) == {'id', 'username'} for user in users)
+
+
+def test_user_listing_pages_across_batches(app):
+    add_users(7)
+    assert [user['id'] for user in UserModel.iter_public(batch_size=3)] == list(range(1, 8))
+    # A batch that ends exactly on the last row must not lose or repeat anything
+    assert [user['id'] for user in UserModel.iter_public(after_id=1, batch_size=3)] == list(range(2, 8))
+
+
+def test_user_listing_honours_after_and_limit(app):
+    add_users(7)
+    assert [user['id'] for user in UserModel.iter_public(after_id=2, limit=4, batch_size=3)] == [3, 4, 5, 6]
+    assert [user['id'] for user in UserModel.iter_public(after_id=5, limit=10, batch_size=3)] == [6, 7]
+    assert list(UserModel.iter_public(after_id=7)) == []
@@ -0,0 +1,81 @@
+import sqlite3
+
+import pytest
+
+from app.api import prefetch
+from app.api.prefetch import SCHEMA, HitTracker, Prefetcher
+from app.api.shared_store import SharedStore
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    return HitTracker(SharedStore(str(tmp_path / 'prefetch.sqlite3'), SCHEMA))
+
+
+class FakeCache(object):
+    def __init__(self, expires):
+        self.expires = expires
+        self.refreshed = []
+
+    def expires_in(self, provider, endpoint, key):
+        return self.expires.get(key)
+
+    def refresh(self, provider, endpoint, key, fetch):
+        self.refreshed.append((endpoint, key, fetch()))
+
+
+class FakeQuota(object):
+    def __init__(self, remaining):
+        self._remaining = remaining
+
+    def remaining(self):
+        return {'openweather': {'remaining': self._remaining}}
+
+
+def test_tracker_ranks_flushed_hits(tracker):
+    for _ in range(3):
+        tracker.record('weather', '60604')
+    tracker.record('weather', '10001')
+    tracker.flush()
+    tracker.record('weather', '10001')
+    tracker.flush()
+    assert tracker.top(1) == [('weather', '60604')]
+
+    tracker.decay(0.2)
+    assert tracker.top(5) == [('weather', '60604')]
+
+
+def test_cycle_refreshes_only_keys_near_expiry(tracker):
+    for key in ('60604', '10001', '94105'):
+        tracker.record('weather', key)
+    tracker.flush()
+    cache = FakeCache({'60604': 10, '10001': 3600})
+    endpoints = {'weather': ('openweather', 'weather', lambda key: {'zip': key})}
+
+    Prefetcher(endpoints, tracker, cache, FakeQuota(50)).run_cycle()
+    assert sorted(key for _, key, _ in cache.refreshed) == ['60604', '94105']
+
+
+def test_cycle_leaves_quota_reserve(tracker):
+    tracker.record('weather', '60604')
+    tracker.flush()
+    cache = FakeCache({})
+    endpoints = {'weather': ('openweather', 'weather', lambda key: {'zip': key})}
+
+    Prefetcher(endpoints, tracker, cache, FakeQuota(1)).run_cycle()
+    assert cache.refreshed == []
+
+
+def test_failed_flush_keeps_hits_and_spares_the_request(tracker, monkeypatch):
+    monkeypatch.setattr(prefetch, 'hit_flush_interval', 0)
+
+    def locked():
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(tracker.store, 'transaction', locked)
+    tracker.record('weather', '60604')
+    tracker.record('weather', '60604')
+
+    del tracker.store.transaction
+    tracker.flush()
+    assert tracker.store.execute('SELECT hits FROM prefetch_hits').fetchall() == [(2,)]
@@ -0,0 +1,39 @@
+import time
+
+import pytest
+
+from app.api.quota import SCHEMA, QuotaExceeded, QuotaManager
+from app.api.shared_store import SharedStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SharedStore(str(tmp_path / 'quota.sqlite3'), SCHEMA)
+
+
+def test_bucket_allows_burst_then_rejects(store):
+    manager = QuotaManager(store=store, limits={'zomato': '3/86400'})
+    for _ in range(3):
+        manager.acquire('zomato', max_wait=0)
+    with pytest.raises(QuotaExceeded):
+        manager.acquire('zomato', max_wait=0)
+    assert manager.remaining()['zomato']['remaining'] == 0
+
+
+def test_bucket_waits_for_refill_within_limit(store):
+    manager = QuotaManager(store=store, limits={'opentripmap': '20/1'})
+    for _ in range(20):
+        manager.acquire('opentripmap', max_wait=0)
+    started = time.time()
+    manager.acquire('opentripmap', max_wait=1)
+    assert 0.03 < time.time() - started < 0.5
+    assert manager.waited == 1
+
+
+def test_buckets_are_shared_between_managers(store):
+    first = QuotaManager(store=store, limits={'ticketmaster': '2/86400'})
+    second = QuotaManager(store=SharedStore(store.path, SCHEMA), limits={'ticketmaster': '2/86400'})
+    first.acquire('ticketmaster', max_wait=0)
+    second.acquire('ticketmaster', max_wait=0)
+    with pytest.raises(QuotaExceeded):
+        first.acquire('ticketmaster', max_wait=0)
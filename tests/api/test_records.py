@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from app.api import encoding, records
+from bench import fake_upstreams
+
+
+def test_events_keep_the_original_shape():
+    event = records.events(fake_upstreams.events({}))[0]
+    assert event == {
+        'name': 'Event 0',
+        'date': '2020-06-01',
+        'classifications': ['Music', 'Rock', 'Pop'],
+        'venue': 'Venue 0',
+        'address': '0 Lake St'
+    }
+    assert event['venue'] == 'Venue 0'
+    with pytest.raises(KeyError):
+        event['missing']
+
+
+def test_restaurants_and_hotels():
+    restaurant = records.restaurants(fake_upstreams.restaurants({}))[3]
+    assert (restaurant['price_scale'], restaurant['rating']) == (4, '4.3')
+
+    hotel = records.hotels(fake_upstreams.places_in_bbox({'lat_min': 41, 'lon_min': -88, 'lat_max': 42, 'lon_max': -87}))[0]
+    assert (hotel.lat, hotel.lon) == (41.1, -87.9)
+
+
+def test_forecast_names_every_point_after_its_city():
+    points = records.forecast(fake_upstreams.forecast({'zip': '60601'}))
+    assert len(points) == 40
+    assert set(point.city for point in points) == {'City 60601'}
+
+
+def test_encoder_writes_records_as_objects():
+    weather = records.weather(fake_upstreams.weather({'zip': '60601'}))
+    decoded = json.loads(encoding.dumps({'weather': weather, 'events': records.events(fake_upstreams.events({}))[:1]}))
+    assert decoded['weather'] == weather.as_dict()
+    assert list(decoded['weather']) == ['city', 'date', 'temperature', 'description']
+    assert decoded['events'][0]['name'] == 'Event 0'
+    assert encoding.loads(encoding.dumps([1, 'a'])) == [1, 'a']
+
+    with pytest.raises(TypeError):
+        encoding.dumps(object())
@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+from app.api.resilience import CircuitBreaker, CircuitOpen, SingleFlight, UpstreamUnavailable
+
+
+def test_single_flight_shares_one_call():
+    flights = SingleFlight()
+    calls = []
+    results = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.05)
+        return {'temperature': 40}
+
+    threads = [threading.Thread(target=lambda: results.append(flights.do('60601', fetch))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{'temperature': 40}] * 5
+    assert flights.shared == 4
+
+
+def test_single_flight_shares_errors_and_forgets_finished_calls():
+    flights = SingleFlight()
+
+    def fail():
+        raise UpstreamUnavailable('down')
+
+    with pytest.raises(UpstreamUnavailable):
+        flights.do('60601', fail)
+    assert flights.do('60601', lambda: 'up') == 'up'
+
+
+def test_breaker_opens_then_probes_half_open():
+    breaker = CircuitBreaker('ticketmaster', failure_threshold=2, reset_timeout=0.05)
+
+    def fail():
+        raise UpstreamUnavailable('down')
+
+    for _ in range(2):
+        with pytest.raises(UpstreamUnavailable):
+            breaker.call(fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.call(lambda: 'never called')
+
+    time.sleep(0.06)
+    with pytest.raises(UpstreamUnavailable):
+        breaker.call(fail)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    assert breaker.call(lambda: 'events') == 'events'
+    assert breaker.state == CircuitBreaker.CLOSED
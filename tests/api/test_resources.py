@@ -0,0 +1,201 @@
+import threading
+import time
+
+import pytest
+
+from app import run  # noqa: F401 resources is imported by the app it registers with
+from app.api import providers, resources
+from app.api.resilience import UpstreamUnavailable
+
+
+class FakeWeather(object):
+    """
+    Stands in for the response cache and the provider; outcomes maps a zipcode to
+    an exception to raise or 'hang' to outlast the batch timeout
+    """
+    def __init__(self):
+        self.cached = {}
+        self.outcomes = {}
+        self.calls = []
+        self.release = threading.Event()
+
+    def get_fresh(self, name, zipcodes):
+        return dict((zipcode, self.cached[zipcode]) for zipcode in zipcodes if zipcode in self.cached)
+
+    def get(self, zipcode):
+        self.calls.append(zipcode)
+        outcome = self.outcomes.get(zipcode)
+        if outcome == 'hang':
+            self.release.wait(5)
+        elif isinstance(outcome, Exception):
+            raise outcome
+        return 'fetched ' + zipcode
+
+    def batch(self, *values):
+        return resources.get_weather_batch('weather', self.get, resources.split_values(values), 'weather')
+
+
+@pytest.fixture
+def weather(monkeypatch):
+    monkeypatch.setattr(resources, 'zipcode_batch_timeout', 0.2)
+    fake = FakeWeather()
+    monkeypatch.setattr(providers, 'get_fresh', fake.get_fresh)
+    yield fake
+    fake.release.set()
+
+
+def test_batch_merges_cache_and_fetches_each_zipcode_once(weather):
+    weather.cached['60601'] = 'cached 60601'
+    assert weather.batch('60601,60602', '60602', ' 60603 ') == {
+        'weather': {'60601': 'cached 60601', '60602': 'fetched 60602', '60603': 'fetched 60603'},
+        'errors': {}
+    }
+    assert sorted(weather.calls) == ['60602', '60603']
+
+
+def test_batch_reports_each_failure_under_its_zipcode(weather):
+    weather.outcomes.update({'60602': UpstreamUnavailable('down'), '60603': KeyError('list'), '60604': 'hang'})
+    body = weather.batch('60604,60603,60602,60601')
+    assert body['weather'] == {'60601': 'fetched 60601'}
+    assert body['errors'] == {
+        '60604': 'The weather provider is unavailable, please try again later',
+        '60603': 'No weather information found',
+        '60602': 'The weather provider is unavailable, please try again later'
+    }
+    assert list(body['errors']) == ['60604', '60603', '60602']
+
+
+def test_batch_with_no_results_is_503_only_when_every_zipcode_was_unavailable(weather):
+    weather.outcomes.update({'60601': UpstreamUnavailable('down'), '60602': 'hang', '60603': KeyError('list')})
+    assert weather.batch('60601,60602') == ({'error': 'The weather provider is unavailable, please try again later'}, 503)
+    assert weather.batch('60601,60603') == ({'error': 'No weather information found'}, 404)
+
+
+def test_batch_size_is_limited(weather, monkeypatch):
+    monkeypatch.setattr(resources, 'zipcode_max_batch', 2)
+    assert weather.batch('60601,60602,60603')[1] == 422
+    assert weather.calls == []
+
+
+@pytest.fixture
+def client(app):
+    from flask_jwt_extended import create_access_token
+
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = 'Bearer ' + create_access_token(identity='traveller')
+    return client
+
+
+@pytest.fixture
+def trip(monkeypatch):
+    """
+    Stubs every provider /trip calls; calls lists them in the order they ran
+    """
+    calls = []
+    geocoded = threading.Event()
+
+    def get_city_details(zipcode):
+        time.sleep(0.05)
+        calls.append('geocode')
+        geocoded.set()
+        return {'city': 'Chicago', 'lat': 41.88, 'lon': -87.63}
+
+    def after_geocoding(name):
+        def fetch(zipcode):
+            # Restaurants and hotels need the city first
+            calls.append((name, geocoded.is_set()))
+            return [name + ' ' + zipcode]
+        return fetch
+
+    def answer(name):
+        def fetch(zipcode):
+            calls.append(name)
+            return {name: zipcode}
+        return fetch
+
+    monkeypatch.setattr(resources, 'get_city_details', get_city_details)
+    monkeypatch.setattr(providers, 'get_weather', answer('weather'))
+    monkeypatch.setattr(providers, 'get_forecast', answer('fiveday'))
+    monkeypatch.setattr(providers, 'get_events', answer('events'))
+    monkeypatch.setattr(providers, 'get_restaurants', after_geocoding('restaurants'))
+    monkeypatch.setattr(providers, 'get_hotels', after_geocoding('hotels'))
+    return calls
+
+
+def test_trip_geocodes_once_before_restaurants_and_hotels(client, trip):
+    response = client.get('/trip?zipcode=60601')
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'zipcode': '60601',
+        'weather': {'weather': '60601'},
+        'fiveday': {'fiveday': '60601'},
+        'restaurants': ['restaurants 60601'],
+        'events': {'events': '60601'},
+        'hotels': ['hotels 60601'],
+        'errors': {}
+    }
+    assert trip.count('geocode') == 1
+    assert ('restaurants', True) in trip and ('hotels', True) in trip
+
+
+def test_trip_reports_failed_providers_beside_the_rest(client, trip, monkeypatch):
+    def down(zipcode):
+        raise UpstreamUnavailable('down')
+
+    monkeypatch.setattr(providers, 'get_events', down)
+    monkeypatch.setattr(providers, 'get_forecast', lambda zipcode: {}['list'])
+    body = client.get('/trip?zipcode=60601').get_json()
+    assert body['weather'] == {'weather': '60601'}
+    assert 'events' not in body and 'fiveday' not in body
+    assert body['errors'] == {'fiveday': 'No weather information found', 'events': 'No event information found'}
+
+
+def test_trip_with_nothing_found_is_404(client, trip, monkeypatch):
+    def missing(zipcode):
+        raise KeyError(zipcode)
+
+    for name in ('get_weather', 'get_forecast', 'get_restaurants', 'get_events', 'get_hotels'):
+        monkeypatch.setattr(providers, name, missing)
+    response = client.get('/trip?zipcode=60601')
+    assert (response.status_code, response.get_json()) == (404, {'error': 'No trip information found'})
+
+
+@pytest.fixture
+def hotels(monkeypatch):
+    """
+    Three hotels around 60601, and addresses for every xid except 'N3'
+    """
+    def get_hotel_info(xid):
+        if xid == 'N3':
+            raise KeyError(xid)
+        return {'name': 'Hotel ' + xid, 'address': xid + ' Wacker Dr'}
+
+    monkeypatch.setattr(providers, 'get_hotel_info', get_hotel_info)
+    monkeypatch.setattr(providers, 'get_hotels', lambda zipcode: [
+        {'name': 'Far', 'rating': 3, 'xid': 'N3', 'distance': 900},
+        {'name': 'Near', 'rating': 2, 'xid': 'N1', 'distance': 100},
+        {'name': 'Middle', 'rating': 1, 'xid': 'N2', 'distance': 500}
+    ])
+
+
+def test_single_hotel_keeps_the_original_shape(client, hotels):
+    assert client.get('/hotel?xid=N1').get_json() == {'name': 'Hotel N1', 'address': 'N1 Wacker Dr'}
+    response = client.get('/hotel?xid=N3')
+    assert (response.status_code, response.get_json()) == (404, {'error': 'No  hotel information found'})
+
+
+def test_hotel_batch_reports_missing_xids_and_is_capped(client, hotels, monkeypatch):
+    body = client.get('/hotel?xid=N1,N3&xid=N2&xid=N1').get_json()
+    assert list(body['hotels']) == ['N1', 'N2']
+    assert body['errors'] == {'N3': 'No hotel information found'}
+
+    monkeypatch.setattr(resources, 'hotel_info_max_batch', 2)
+    assert client.get('/hotel?xid=N1,N2,N3').status_code == 422
+
+
+def test_hotels_inline_addresses_for_the_nearest(client, hotels):
+    body = client.get('/hotels?zipcode=60601&addresses=2').get_json()
+    assert [hotel['xid'] for hotel in body] == ['N1', 'N2', 'N3']
+    assert [hotel.get('address') for hotel in body] == [
+        {'name': 'Hotel N1', 'address': 'N1 Wacker Dr'}, {'name': 'Hotel N2', 'address': 'N2 Wacker Dr'}, None
+    ]
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from app.api.resilience import UpstreamUnavailable
+from app.api.response_cache import SCHEMA, ResponseCache
+from app.api.shared_store import SharedStore
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(store=SharedStore(str(tmp_path / 'cache.sqlite3'), SCHEMA), ttls={'openweather': 60})
+
+
+def test_fresh_entries_skip_fetch(cache):
+    calls = []
+    fetch = lambda: calls.append(1) or {'city': 'Chicago'}
+    assert cache.get_or_fetch('openweather', 'weather', '60601', fetch) == {'city': 'Chicago'}
+    assert cache.get_or_fetch('openweather', 'weather', '60601', fetch) == {'city': 'Chicago'}
+    assert len(calls) == 1
+    assert cache.stats()['hits'] == 1
+
+
+def test_stale_entries_are_served_while_refreshing(cache):
+    cache.ttls['openweather'] = 0.05
+    cache.get_or_fetch('openweather', 'weather', '60601', lambda: {'temperature': 1})
+    time.sleep(0.06)
+
+    assert cache.get_or_fetch('openweather', 'weather', '60601', lambda: {'temperature': 2}) == {'temperature': 1}
+    cache._executor.shutdown(wait=True)
+    assert cache.get_or_fetch('openweather', 'weather', '60601', lambda: {'temperature': 3}) == {'temperature': 2}
+
+
+def test_failed_fetch_is_not_cached(cache):
+    def fail():
+        raise KeyError('list')
+
+    with pytest.raises(KeyError):
+        cache.get_or_fetch('openweather', 'forecast', '60601', fail)
+    assert cache.get_or_fetch('openweather', 'forecast', '60601', lambda: []) == []
+
+
+def test_expired_entries_are_served_when_provider_is_unavailable(cache):
+    cache.ttls['openweather'] = 0.01
+    cache.get_or_fetch('openweather', 'weather', '60601', lambda: {'temperature': 1})
+    time.sleep(0.03)
+
+    def down():
+        raise UpstreamUnavailable('openweather circuit is open')
+
+    assert cache.get_or_fetch('openweather', 'weather', '60601', down) == {'temperature': 1}
+    assert cache.stats()['fallback_hits'] == 1
+    with pytest.raises(UpstreamUnavailable):
+        cache.get_or_fetch('openweather', 'weather', '94103', down)
+
+
+def test_get_many_returns_only_fresh_entries(cache):
+    cache.get_or_fetch('openweather', 'weather', '60601', lambda: {'city': 'Chicago'})
+    cache.get_or_fetch('openweather', 'weather', '60602', lambda: {'city': 'Chicago'})
+    cache.store.execute('UPDATE response_cache SET fresh_until = 0 WHERE cache_key = ?',
+                        (cache.make_key('openweather', 'weather', '60602'),))
+
+    assert cache.get_many('openweather', 'weather', ['60601', '60602', '60603']) == {'60601': {'city': 'Chicago'}}
+    assert cache.get_many('openweather', 'weather', []) == {}
@@ -0,0 +1,141 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.api.revocation import BloomFilter, GroupCommit, RevocationIndex
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    jtis = ['jti-{}'.format(i) for i in range(1000)]
+    for jti in jtis:
+        bloom.add(jti)
+    assert all(jti in bloom for jti in jtis)
+    false_positives = sum('other-{}'.format(i) in bloom for i in range(1000))
+    assert false_positives < 50
+
+
+def test_index_syncs_incrementally_from_loader():
+    rows = [(1, 'a'), (2, 'b')]
+    requested = []
+
+    def loader(after_id):
+        requested.append(after_id)
+        return [row for row in rows if row[0] > after_id]
+
+    index = RevocationIndex(loader, capacity=10, sync_interval=0, overlap=0)
+    assert index.might_contain('a')
+    assert not index.might_contain('c')
+    rows.append((3, 'c'))
+    assert index.might_contain('c')
+    assert requested == [0, 2, 2]
+
+
+def test_index_picks_up_ids_committed_out_of_order():
+    # Row 3 was inserted before row 4 but its transaction committed after the first sync
+    rows = [(1, 'a'), (2, 'b'), (4, 'd')]
+    index = RevocationIndex(lambda after_id: [row for row in sorted(rows) if row[0] > after_id],
+                            capacity=10, sync_interval=0, overlap=5)
+    assert not index.might_contain('c')
+    rows.append((3, 'c'))
+    assert index.might_contain('c')
+    # Rows re-read inside the overlap are not counted again
+    index.sync()
+    assert index._filter.count == 4
+
+
+def test_concurrent_lookups_share_one_sync():
+    calls = []
+
+    def loader(after_id):
+        calls.append(after_id)
+        time.sleep(0.05)
+        return [(1, 'a')]
+
+    index = RevocationIndex(loader, capacity=10, sync_interval=60, overlap=0)
+    index.sync()
+    index._synced_at -= 60   # the next sync is due
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(index.might_contain('a'))) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Lookups arriving during the sync answer from the filter already loaded
+    assert results == [True] * 20
+    assert len(calls) == 2
+
+
+def test_index_grows_past_capacity():
+    rows = [(i, 'jti-{}'.format(i)) for i in range(1, 50)]
+    index = RevocationIndex(lambda after_id: [row for row in rows if row[0] > after_id], capacity=10, sync_interval=0)
+    index.sync()
+    assert index.capacity >= 49
+    assert all(index.might_contain(jti) for _, jti in rows)
+
+
+def test_index_rebuild_drops_purged_rows():
+    rows = [(1, 'a'), (2, 'b')]
+    index = RevocationIndex(lambda after_id: [row for row in rows if row[0] > after_id],
+                            capacity=10, sync_interval=0, rebuild_interval=0)
+    assert index.might_contain('a')
+    rows.remove((1, 'a'))
+    assert not index.might_contain('a')
+    assert index.might_contain('b')
+
+
+def test_group_commit_batches_rows_queued_behind_a_write():
+    batches = []
+    writing = threading.Event()
+    release = threading.Event()
+
+    def writer(rows):
+        batches.append([row['jti'] for row in rows])
+        if len(batches) == 1:
+            writing.set()
+            release.wait(5)
+
+    group = GroupCommit(writer, batch_size=10)
+    first = threading.Thread(target=group.add, args=({'jti': 'a'},))
+    first.start()
+    writing.wait(5)
+    # These arrive while 'a' is being written, so none of them has returned yet
+    others = [threading.Thread(target=group.add, args=({'jti': jti},)) for jti in 'bcd']
+    for thread in others:
+        thread.start()
+    time.sleep(0.05)
+    assert all(thread.is_alive() for thread in others)
+
+    release.set()
+    for thread in [first] + others:
+        thread.join(5)
+    assert batches[0] == ['a']
+    assert sorted(batches[1]) == ['b', 'c', 'd']
+    assert (group.batches, group.written) == (2, 4)
+
+
+def test_group_commit_raises_when_the_write_fails():
+    def writer(rows):
+        raise IOError('database is down')
+
+    group = GroupCommit(writer)
+    with pytest.raises(IOError):
+        group.add({'jti': 'a'})
+    assert group.failed == 1 and group.written == 0
+
+
+def test_logout_is_durable_before_it_returns(app):
+    from app.api import models
+    from app.api.models import RevokedTokenModel
+
+    models.revocation_index.reset()
+    RevokedTokenModel(jti='revoked', expires_at=datetime.utcnow() + timedelta(hours=1)).add()
+    assert RevokedTokenModel.query.filter_by(jti='revoked').count() == 1
+    assert RevokedTokenModel.is_jti_blacklisted('revoked')
+
+    # A worker whose filter only sees what the database holds agrees
+    models.revocation_index.reset()
+    assert RevokedTokenModel.is_jti_blacklisted('revoked')
+    assert not RevokedTokenModel.is_jti_blacklisted('still-valid')
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+from app.api.shared_store import SharedStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SCHEMA = ('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)',)
+
+
+def test_threads_get_their_own_connection(tmp_path):
+    store = SharedStore(str(tmp_path / 'store.sqlite3'), SCHEMA)
+    with store.transaction() as conn:
+        conn.execute("INSERT INTO counters VALUES ('hits', 1)")
+    assert store.execute('SELECT value FROM counters').fetchone() == (1,)
+    assert store.connection() is store.connection()
+
+
+def test_greenlets_share_one_connection_per_process(tmp_path):
+    # gevent has to patch threading before anything imports it, so this runs in its own interpreter
+    script = textwrap.dedent('''
+        from gevent import monkey
+        monkey.patch_all()
+        import sys
+        import gevent
+        from app.api import shared_store
+        from app.api.shared_store import SharedStore
+
+        opened = []
+        connect = SharedStore._connect
+        SharedStore._connect = lambda self, **kwargs: opened.append(1) or connect(self, **kwargs)
+        store = SharedStore(sys.argv[1], [sys.argv[2]])
+
+        def bump():
+            with store.transaction() as conn:
+                value = conn.execute("SELECT value FROM counters WHERE name = 'hits'").fetchone()
+                gevent.sleep(0)   # another greenlet runs here and must wait for this transaction
+                conn.execute("INSERT OR REPLACE INTO counters VALUES ('hits', ?)", ((value[0] if value else 0) + 1,))
+
+        gevent.joinall([gevent.spawn(bump) for _ in range(50)], raise_error=True)
+        assert shared_store.greenlets()
+        print(len(opened), store.execute('SELECT value FROM counters').fetchone()[0])
+    ''')
+    output = subprocess.check_output([sys.executable, '-c', script, str(tmp_path / 'store.sqlite3'), SCHEMA[0]],
+                                     cwd=ROOT, universal_newlines=True)
+    assert output.split() == ['1', '50']
@@ -0,0 +1,92 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from app.api import quota, upstream
+from app.api.quota import SCHEMA as QUOTA_SCHEMA
+from app.api.quota import QuotaExceeded, QuotaManager
+from app.api.resilience import CircuitBreaker, CircuitOpen
+from app.api.shared_store import SharedStore
+from bench.fake_upstreams import _Server
+
+
+def test_session_is_shared_across_threads():
+    sessions = []
+    threads = [threading.Thread(target=lambda: sessions.append(upstream.get_session())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(session is upstream.get_session() for session in sessions)
+
+
+def test_session_mounts_pooled_adapter_with_retries():
+    adapter = upstream.get_session().get_adapter('https://api.openweathermap.org')
+    assert adapter._pool_maxsize == upstream.pool_maxsize
+    assert adapter.max_retries.total == upstream.retry_total
+
+
+def test_open_breaker_fails_fast_without_spending_quota(tmp_path, monkeypatch):
+    manager = QuotaManager(store=SharedStore(str(tmp_path / 'quota.sqlite3'), QUOTA_SCHEMA),
+                           limits={'zomato': '1/86400'})
+    monkeypatch.setattr(upstream, 'quota', manager)
+    monkeypatch.setattr(upstream, '_breakers', {'zomato': CircuitBreaker('zomato', failure_threshold=1)})
+    monkeypatch.setattr(quota, 'quota_max_wait', 0)
+    breaker = upstream.breaker('zomato')
+    breaker._record_failure()
+
+    for _ in range(3):
+        with pytest.raises(CircuitOpen):
+            upstream.get_json('zomato', 'https://zomato.invalid/cities')
+    assert manager.remaining()['zomato']['remaining'] == 1
+
+    # A drained bucket is not the provider's fault, so it does not trip or close the breaker
+    manager.acquire('zomato')
+    breaker.opened_at = 0
+    with pytest.raises(QuotaExceeded):
+        upstream.get_json('zomato', 'https://zomato.invalid/cities')
+    assert breaker.state == CircuitBreaker.OPEN and breaker.failures == 1
+
+
+@pytest.fixture
+def slow_server():
+    hits = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            if self.path == '/slow':
+                time.sleep(0.3)
+            try:
+                self.send_response(503 if self.path == '/down' else 200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+            except (BrokenPipeError, ConnectionResetError):
+                pass   # the client gave up waiting
+
+        def log_message(self, *args):
+            pass
+
+    server = _Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.hits = hits
+    yield server
+    server.shutdown()
+
+
+def test_read_timeouts_are_not_retried_but_server_errors_are(slow_server, monkeypatch):
+    monkeypatch.setattr(upstream, 'retry_backoff', 0)
+    monkeypatch.setattr(upstream, '_sessions', {})
+    monkeypatch.setattr(upstream, '_local', threading.local())
+    url = 'http://127.0.0.1:{}'.format(slow_server.server_port)
+
+    with pytest.raises(requests.RequestException):
+        upstream.get(url + '/slow', timeout=(1, 0.1))
+    assert slow_server.hits == ['/slow']
+
+    assert upstream.get(url + '/down').status_code == 503
+    assert slow_server.hits[1:] == ['/down'] * (upstream.retry_total + 1)
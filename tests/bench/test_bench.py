@@ -0,0 +1,47 @@
+import pytest
+
+from app.api import geotiles, providers, quota, upstream
+from app.api.shared_store import SharedStore
+from bench.fake_upstreams import FakeUpstreams
+from bench.run import compare, percentile
+
+
+@pytest.fixture
+def upstreams(monkeypatch, tmp_path):
+    upstreams = FakeUpstreams(latency=0, jitter=0).start()
+    monkeypatch.setattr(providers, 'open_weather_url', upstreams.url + '/openweather')
+    monkeypatch.setattr(providers, 'zomato_url', upstreams.url + '/zomato')
+    monkeypatch.setattr(providers, 'ticketmaster_url', upstreams.url + '/ticketmaster')
+    monkeypatch.setattr(providers, 'opentrip_url', upstreams.url + '/opentripmap')
+    monkeypatch.setattr(providers.gazetteer, 'lookup', lambda zipcode: None)
+    monkeypatch.setattr(providers, 'hotel_tiles', geotiles.TileIndex(
+        'accomodations', providers.fetch_hotel_tile, SharedStore(str(tmp_path / 'tiles.sqlite3'), geotiles.SCHEMA)))
+    monkeypatch.setattr(upstream, 'quota', quota.QuotaManager(SharedStore(str(tmp_path / 'quota.sqlite3'), quota.SCHEMA)))
+    yield upstreams
+    upstreams.stop()
+
+
+def test_fake_payloads_parse_like_the_real_providers(upstreams):
+    assert providers.fetch_weather('60601')['city'] == 'City 60601'
+    assert len(providers.fetch_forecast('60601')) == 40
+    assert len(providers.fetch_restaurants('60602')) == 20
+    assert providers.fetch_events('60601')[0]['classifications'] == ['Music', 'Rock', 'Pop']
+    hotels = providers.fetch_hotels('60603')
+    assert hotels[0]['xid'].startswith('T')
+    assert hotels == sorted(hotels, key=lambda hotel: hotel['distance'])
+    assert hotels[-1]['distance'] <= providers.HOTEL_RADIUS
+    assert providers.fetch_hotel_info('N1000')['street'] == 'Wacker Dr'
+    assert upstreams.stats()['calls']['zomato'] == 2
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 95) == 0.0
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    before = {'weather': {'p50_ms': 50, 'p95_ms': 100, 'p99_ms': 150, 'rps': 200, 'upstream_per_request': 0.1, 'errors': 0}}
+    after = {'weather': {'p50_ms': 55, 'p95_ms': 160, 'p99_ms': 150, 'rps': 150, 'upstream_per_request': 0.1, 'errors': 0}}
+    assert compare(after, before, 0.2) == ['weather p95_ms 100 -> 160', 'weather rps 200 -> 150']